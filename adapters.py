@@ -0,0 +1,275 @@
+import re
+import sqlite3
+from connections import open_schema_probe
+
+# Each app adapter describes how to read messages out of one app's database:
+# the tables/columns that identify the schema, the table to read and how its
+# columns map onto the logical columns the parser normalizes:
+#
+#   id          grows with every new message (used for incremental parsing and
+#               as the stable message id); the table's rowid when not mapped
+#   contact     chat the message belongs to, as text
+#   text        message body
+#   timestamp   ms or seconds since epoch
+#   from_me     1 for messages sent by the device owner
+#   media_name, media_url, media_mime, media_type
+#
+# App differences are expressed in the SQL projection, so every adapter shares
+# the same streaming, filtering and caching code in parser.py.
+
+AUTO_DETECT = "Auto-detect"
+
+ADAPTERS = []
+
+def register_adapter(adapter_class):
+    # Class decorator; adapters are tried in registration order
+    ADAPTERS.append(adapter_class())
+    return adapter_class
+
+def is_auto(app_name):
+    return app_name is None or app_name.lower() in ("auto", AUTO_DETECT.lower())
+
+def app_names():
+    return list(dict.fromkeys(adapter.app for adapter in ADAPTERS))
+
+def is_supported(app_name):
+    return is_auto(app_name) or app_name.lower() in (name.lower() for name in app_names())
+
+def read_schema(cursor):
+    # {table: set of columns} for every table in the database
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    schema = {}
+    for (table,) in cursor.fetchall():
+        cursor.execute(f'PRAGMA table_info("{table}")')
+        schema[table] = {col[1] for col in cursor.fetchall()}
+    return schema
+
+def detect_adapter(schema):
+    # First adapter whose fingerprint matches, None for unknown databases
+    for adapter in ADAPTERS:
+        if adapter.matches(schema):
+            return adapter
+    return None
+
+def detect_app(db_path):
+    # App name of a database file, None when no adapter recognizes it
+    try:
+        conn = open_schema_probe(db_path)
+        try:
+            adapter = detect_adapter(read_schema(conn.cursor()))
+        finally:
+            conn.close()
+    except (sqlite3.Error, OSError):
+        return None
+    return None if adapter is None else adapter.app
+
+def get_adapter(app_name, schema):
+    # Adapter for app_name ("Auto-detect" to go by the schema alone). An app
+    # picked explicitly falls back to any of its adapters whose table exists.
+    if is_auto(app_name):
+        adapter = detect_adapter(schema)
+        if adapter is None:
+            raise RuntimeError("Unrecognized database: no app adapter matches its schema")
+        return adapter
+
+    candidates = [adapter for adapter in ADAPTERS if adapter.app.lower() == app_name.lower()]
+    for adapter in candidates:
+        if adapter.matches(schema):
+            return adapter
+    for adapter in candidates:
+        if adapter.table in schema:
+            return adapter
+    raise RuntimeError(f"This doesn't look like a {app_name} database")
+
+class AppAdapter:
+    app = None
+    # Table the messages are read from (or a join, see from_clause)
+    table = None
+    # {table: columns} that must all exist for the schema to be this app's
+    fingerprint = {}
+    # Logical column -> source column, "column" of table or "table.column"
+    columns = {}
+    # Logical column -> SQL template wrapping the source column as {0}
+    expressions = {}
+    # A row is a message when one of these logical columns is not NULL
+    content_columns = ()
+    # Working copy indexes, name -> logical columns
+    indexes = {
+        "parsepal_contact_time": ("contact", "timestamp"),
+        "parsepal_time": ("timestamp",),
+        "parsepal_direction_time": ("from_me", "timestamp"),
+    }
+    # Indexes the joins of from_clause need, name -> (table, columns). The
+    # parser creates them on a working copy when the source DB lacks them.
+    join_indexes = {}
+
+    def matches(self, schema):
+        return all(table in schema and set(cols) <= schema[table] for table, cols in self.fingerprint.items())
+
+    def _source(self, source):
+        table, _, column = source.rpartition(".")
+        return table or self.table, column
+
+    def has_column(self, schema, source):
+        table, column = self._source(source)
+        return column in schema.get(table, set())
+
+    def from_clause(self, schema):
+        return self.table
+
+    def projection(self, cursor, schema):
+        # {logical column: SQL expression} for the columns this database has
+        projection = {
+            logical: self.expressions.get(logical, "{0}").format(source)
+            for logical, source in self.columns.items()
+            if self.has_column(schema, source)
+        }
+        projection.setdefault("id", f"{self.table}.rowid")
+        return projection
+
+    def chat_clause(self, projection, contact):
+        # WHERE fragment, with one "?" for contact, selecting one chat's messages
+        return f"{projection.get('contact', 'NULL')} IS ?"
+
+    def source_indexes(self, schema):
+        # {index name: (table, columns)} of the working copy indexes that map
+        # onto plain columns of this database
+        indexes = {}
+        for name, logical_cols in self.indexes.items():
+            sources = [self.columns.get(logical) for logical in logical_cols]
+            if any(source is None or logical in self.expressions or not self.has_column(schema, source)
+                   for logical, source in zip(logical_cols, sources)):
+                continue
+            tables = {self._source(source)[0] for source in sources}
+            if len(tables) == 1:
+                indexes[name] = (tables.pop(), [self._source(source)[1] for source in sources])
+        for name, (table, cols) in self.join_indexes.items():
+            # The lookup column comes first, the rest only make it covering
+            present = [col for col in cols if self.has_column(schema, f"{table}.{col}")]
+            if present and present[0] == cols[0]:
+                indexes[name] = (table, present)
+        return indexes
+
+@register_adapter
+class WhatsAppModern(AppAdapter):
+    # msgstore.db after the split into message, chat, jid and message_media.
+    # Registered first: transitional DBs still carry a legacy messages table.
+    app = "WhatsApp"
+    table = "message"
+    fingerprint = {
+        "message": {"_id", "chat_row_id", "from_me", "timestamp", "text_data"},
+        "chat": {"_id", "jid_row_id"},
+        "jid": {"_id", "raw_string"},
+    }
+    columns = {
+        "id": "message._id",
+        "contact": "jid.raw_string",
+        "text": "message.text_data",
+        "timestamp": "message.timestamp",
+        "from_me": "message.from_me",
+        "media_name": "message_media.file_path",
+        "media_url": "message_media.message_url",
+        "media_mime": "message_media.mime_type",
+        "media_type": "message.message_type",
+    }
+    content_columns = ("text", "media_name")
+    # Each join is a single index lookup per message, the media one covering
+    # every projected column, so parsing stays linear in the message count
+    join_indexes = {
+        "parsepal_chat_jid": ("chat", ("_id", "jid_row_id")),
+        "parsepal_jid_raw": ("jid", ("_id", "raw_string")),
+        "parsepal_media_covering": ("message_media", ("message_row_id", "file_path", "message_url", "mime_type")),
+        "parsepal_message_chat_time": ("message", ("chat_row_id", "timestamp")),
+    }
+
+    def chat_clause(self, projection, contact):
+        # Looks the chat up first, so its messages are a range of the
+        # (chat_row_id, timestamp) index. jid_row_id is unique in chat.
+        if contact is None:
+            return super().chat_clause(projection, contact)
+        return ("message.chat_row_id = (SELECT chat._id FROM chat JOIN jid ON jid._id = chat.jid_row_id "
+                "WHERE jid.raw_string = ?)")
+
+    def from_clause(self, schema):
+        joins = (
+            "message"
+            " LEFT JOIN chat ON chat._id = message.chat_row_id"
+            " LEFT JOIN jid ON jid._id = chat.jid_row_id"
+        )
+        if "message_media" in schema:
+            joins += " LEFT JOIN message_media ON message_media.message_row_id = message._id"
+        return joins
+
+@register_adapter
+class WhatsAppLegacy(AppAdapter):
+    # msgstore.db from before the message/jid/chat split
+    app = "WhatsApp"
+    table = "messages"
+    fingerprint = {"messages": {"key_remote_jid", "key_from_me"}}
+    columns = {
+        "id": "_id",
+        "contact": "key_remote_jid",
+        "text": "data",
+        "timestamp": "timestamp",
+        "from_me": "key_from_me",
+        "media_name": "media_name",
+        "media_url": "media_url",
+        "media_mime": "media_mime_type",
+        "media_type": "media_wa_type",
+    }
+    content_columns = ("text", "media_name")
+
+@register_adapter
+class Messenger(AppAdapter):
+    # Facebook Messenger threads_db2. Attachments and the sender are JSON.
+    app = "Messenger"
+    table = "messages"
+    fingerprint = {"messages": {"msg_id", "thread_key", "timestamp_ms"}}
+    columns = {
+        "contact": "thread_key",
+        "text": "text",
+        "timestamp": "timestamp_ms",
+        "media_name": "attachments",
+        "media_mime": "attachments",
+        "media_type": "attachments",
+    }
+    expressions = {
+        "media_name": "CASE WHEN json_valid({0}) THEN json_extract({0}, '$[0].filename') END",
+        "media_mime": "CASE WHEN json_valid({0}) THEN json_extract({0}, '$[0].mime_type') END",
+        "media_type": "CASE WHEN json_valid({0}) THEN "
+                      "substr(json_extract({0}, '$[0].mime_type'), 1, instr(json_extract({0}, '$[0].mime_type'), '/') - 1) END",
+    }
+    content_columns = ("text", "media_name")
+
+    # One-to-one thread keys end in the device owner's id
+    OWNER_THREAD = re.compile(r"^ONE_TO_ONE:\d+:(\d+)$")
+
+    def projection(self, cursor, schema):
+        projection = super().projection(cursor, schema)
+        if not self.has_column(schema, "sender"):
+            return projection
+        cursor.execute("SELECT thread_key FROM messages WHERE thread_key LIKE 'ONE_TO_ONE:%' LIMIT 1")
+        row = cursor.fetchone()
+        owner = self.OWNER_THREAD.match(row[0]) if row and isinstance(row[0], str) else None
+        if owner is not None:
+            projection["from_me"] = (
+                "CASE WHEN json_valid(sender) THEN "
+                f"json_extract(sender, '$.user_key') = 'FACEBOOK:{owner.group(1)}' END"
+            )
+        return projection
+
+@register_adapter
+class Telegram(AppAdapter):
+    # Telegram for Android cache4.db. Message text is inside serialized
+    # TL objects, so only chat, time and direction come out of SQL.
+    app = "Telegram"
+    table = "messages_v2"
+    fingerprint = {"messages_v2": {"mid", "uid", "date", "out"}}
+    columns = {
+        "contact": "uid",
+        "timestamp": "date",
+        "from_me": "out",
+    }
+    expressions = {
+        "contact": "CAST({0} AS TEXT)",
+    }
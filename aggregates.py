@@ -0,0 +1,76 @@
+import pandas as pd
+from filters import parse_date_filters, has_media
+from diagnostics import traced
+
+CUBE_KEYS = ["Contact", "date", "Direction"]
+
+@traced("cube", rows=len)
+def build_cube(df):
+    # Message and media counts per (contact, day, direction), computed once per
+    # parse. The *_at_midnight counts cover messages stamped exactly 00:00:00,
+    # so an end date, which includes its own midnight, can be answered exactly.
+    timestamps = pd.to_datetime(df['timestamp'])
+    dates = timestamps.dt.normalize()
+    media = has_media(df)
+    at_midnight = timestamps == dates
+    cells = pd.DataFrame({
+        "Contact": df['Contact'],
+        "date": dates,
+        "Direction": df['Direction'],
+        "messages": 1,
+        "media": media.astype(int),
+        "messages_at_midnight": at_midnight.astype(int),
+        "media_at_midnight": (media & at_midnight).astype(int)
+    })
+    return cells.groupby(CUBE_KEYS, dropna=False, observed=True, sort=True).sum().reset_index()
+
+def cube_can_answer(filters):
+    # Text search needs the messages themselves, and the date bounds must be
+    # whole days for day cells to be exact
+    if filters["search"]:
+        return False
+    start_dt, end_dt, _ = parse_date_filters(filters)
+    return all(dt is None or dt == dt.normalize() for dt in (start_dt, end_dt))
+
+def _select_cells(cube, filters):
+    cells = cube
+    if filters["direction"] != "All":
+        cells = cells[cells['Direction'] == filters["direction"]]
+    if filters["contacts"]:
+        cells = cells[cells['Contact'].isin(filters["contacts"])]
+
+    start_dt, end_dt, _ = parse_date_filters(filters)
+    if start_dt is not None:
+        cells = cells[cells['date'] >= start_dt]
+    if end_dt is not None:
+        # Only the midnight messages of the end day itself are included
+        cells = cells[cells['date'] <= end_dt]
+        on_end_day = (cells['date'] == end_dt).to_numpy()
+        if on_end_day.any():
+            cells = cells.copy()
+            for col in ("messages", "media"):
+                cells.loc[on_end_day, col] = cells.loc[on_end_day, col + "_at_midnight"]
+    return cells
+
+@traced("cube_stats")
+def cube_stats(cube, filters):
+    # Same totals as filters.compute_stats (minus the keyword count), from the
+    # pre-aggregated cells instead of the messages
+    cells = _select_cells(cube, filters)
+    total = cells['messages'].sum()
+    if total == 0:
+        return None
+
+    per_day = cells.dropna(subset=['date']).groupby('date')['messages'].sum()
+    per_day.index = per_day.index.date
+    return {
+        "total": total,
+        "sent": cells.loc[cells['Direction'] == 'Sent', 'messages'].sum(),
+        "received": cells.loc[cells['Direction'] == 'Received', 'messages'].sum(),
+        "counts_per_day": per_day[per_day > 0]
+    }
+
+def cube_media_counts(cube, filters):
+    cells = _select_cells(cube, filters)
+    counts = cells.groupby('Contact', observed=True)['media'].sum()
+    return counts[counts > 0].sort_values(ascending=False, kind="stable")
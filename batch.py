@@ -0,0 +1,66 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from parser import parse_db, concat_chunks
+from diagnostics import traced
+
+REPORT_COLUMNS = ["source_db", "rows", "seconds", "error"]
+
+def parse_one(db_path, app_name):
+    # Runs in a worker process, errors are reported instead of raised so one
+    # broken DB doesn't sink the whole batch
+    start = time.perf_counter()
+    try:
+        df = parse_db(db_path, app_name)
+        error = None
+    except Exception as e:
+        df = None
+        error = str(e)
+    return {"db_path": db_path, "df": df, "error": error, "seconds": time.perf_counter() - start}
+
+def process_pool(max_workers=None):
+    # Workers are spawned, not forked: a forked child would inherit the
+    # parent's pooled SQLite connections (unusable across fork) and any lock
+    # another thread held at fork time, such as the connection pool's
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+def submit_batch(executor, db_paths, app_name):
+    return [executor.submit(parse_one, db_path, app_name) for db_path in db_paths]
+
+def merge_results(results):
+    # Tags every message with the DB it came from and merges them into one
+    # frame, alongside a per-file report of row counts, timings and errors
+    frames = []
+    report = []
+    for result in results:
+        df = result["df"]
+        report.append({
+            "source_db": result["db_path"],
+            "rows": 0 if df is None else len(df),
+            "seconds": round(result["seconds"], 3),
+            "error": result["error"]
+        })
+        if df is not None:
+            frames.append(df.assign(source_db=result["db_path"]))
+
+    merged = concat_chunks(frames)
+    if "source_db" not in merged:
+        merged["source_db"] = pd.Series(dtype=object)
+    return merged, pd.DataFrame(report, columns=REPORT_COLUMNS)
+
+@traced("batch", rows=lambda result: len(result[0]))
+def parse_many(db_paths, app_name, max_workers=None, progress_callback=None):
+    # Parses every DB in a process pool. progress_callback(done, total) is
+    # called as each file finishes. Results are merged in db_paths order.
+    db_paths = list(dict.fromkeys(db_paths))
+    results = {}
+    with process_pool(max_workers) as executor:
+        futures = submit_batch(executor, db_paths, app_name)
+        for future in as_completed(futures):
+            result = future.result()
+            results[result["db_path"]] = result
+            if progress_callback is not None:
+                progress_callback(len(results), len(db_paths))
+
+    return merge_results([results[db_path] for db_path in db_paths])
@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from parser import _build_query, _select_sql, _normalize_rows, iter_parse_db, concat_chunks, parse_db
+from connections import readonly_connection
+from sampleDBcreator import make_synthetic_db
+from filters import empty_filters, filter_messages, compute_stats, build_media_df
+from utils import find_sqlite_files
+from cache import DEFAULT_CACHE_DIR
+
+# Speedup over the per-row loop that the vectorized normalization must reach
+MIN_SPEEDUP = 10.0
+
+def legacy_normalize_rows(selected_cols, rows):
+    # The per-row loop parse_db used before normalization was vectorized,
+    # kept here as the baseline for speed and output comparisons
+    results = []
+    for row in rows:
+        row_dict = dict(zip(selected_cols, row))
+
+        timestamp = row_dict.get("timestamp")
+        dt = None
+        if timestamp is not None:
+            try:
+                if isinstance(timestamp, (int, float)):
+                    if timestamp > 1e12:
+                        dt = datetime.utcfromtimestamp(timestamp / 1000)
+                    elif timestamp > 1e9:
+                        dt = datetime.utcfromtimestamp(timestamp)
+            except Exception:
+                dt = None
+
+        media_path = row_dict.get("media_name") or row_dict.get("media_url")
+
+        direction = None
+        if "from_me" in row_dict:
+            direction = "Sent" if row_dict["from_me"] == 1 else "Received"
+
+        results.append({
+            "Contact": row_dict.get("contact"),
+            "Message": row_dict.get("text"),
+            "timestamp": dt,
+            "media_path": media_path,
+            "media_mime": row_dict.get("media_mime"),
+            "media_type": row_dict.get("media_type"),
+            "Direction": direction,
+            "message_id": row_dict.get("id")
+        })
+
+    return pd.DataFrame(results)
+
+def make_benchmark_db(folder, message_count, schema="legacy"):
+    return make_synthetic_db(os.path.join(folder, f"msgstore_{schema}.db"), message_count, schema)
+
+def fetch_rows(db_path):
+    with readonly_connection(db_path) as conn:
+        cursor = conn.cursor()
+        query = _build_query(cursor, "WhatsApp")
+        cursor.execute(_select_sql(query), query["params"])
+        return [description[0] for description in cursor.description], cursor.fetchall()
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def check_edge_cases():
+    cols = ["contact", "text", "timestamp", "media_name", "media_url", "from_me"]
+    rows = [
+        ("a@s.whatsapp.net", "ms", 1672531200123, "/m/a.jpg", None, 1),
+        ("b@s.whatsapp.net", "seconds", 1672531200, "", "http://x/b.jpg", 0),
+        ("c@s.whatsapp.net", "float seconds", 1672531200.5, None, None, None),
+        ("d@s.whatsapp.net", "too small", 12345, None, "", 1),
+        ("e@s.whatsapp.net", "text", "1672531200123", None, None, "1"),
+        (None, None, None, None, None, 1),
+    ]
+    pd.testing.assert_frame_equal(_normalize_rows(cols, rows), legacy_normalize_rows(cols, rows))
+
+def run(message_count):
+    check_edge_cases()
+
+    with tempfile.TemporaryDirectory() as folder:
+        db_path = make_benchmark_db(folder, message_count)
+        (selected_cols, rows), fetch_time = timed(fetch_rows, db_path)
+
+    legacy_df, legacy_time = timed(legacy_normalize_rows, selected_cols, rows)
+    vector_df, vector_time = timed(_normalize_rows, selected_cols, rows)
+    pd.testing.assert_frame_equal(vector_df, legacy_df)
+
+    speedup = legacy_time / vector_time
+    print(f"rows:                 {len(rows)}")
+    print(f"SQL fetch:            {fetch_time:.2f}s")
+    print(f"legacy normalize:     {legacy_time:.2f}s")
+    print(f"vectorized normalize: {vector_time:.2f}s")
+    print(f"speedup:              {speedup:.1f}x (outputs identical)")
+    return speedup
+
+def memory_report(message_count):
+    # Per-column memory of the parsed frame as the chunks come out of
+    # iter_parse_db, and after concat_chunks has compacted the dtypes
+    with tempfile.TemporaryDirectory() as folder:
+        db_path = make_benchmark_db(folder, message_count)
+        chunks = list(iter_parse_db(db_path, "WhatsApp"))
+    plain_df = pd.concat(chunks, ignore_index=True)
+    compact_df = concat_chunks(chunks)
+    pd.testing.assert_frame_equal(compact_df.astype(plain_df.dtypes.to_dict()), plain_df)
+
+    plain = plain_df.memory_usage(deep=True, index=False)
+    compact = compact_df.memory_usage(deep=True, index=False)
+    mb = 1024 ** 2
+    print(f"rows: {len(plain_df)}")
+    print(f"{'column':<12} {'dtype':<16} {'plain MB':>9} {'compact MB':>11}")
+    for col in plain_df.columns:
+        print(f"{col:<12} {str(compact_df[col].dtype):<16} {plain[col] / mb:>9.1f} {compact[col] / mb:>11.1f}")
+    print(f"{'total':<29} {plain.sum() / mb:>9.1f} {compact.sum() / mb:>11.1f}")
+    return plain.sum() / compact.sum()
+
+# Suite: times the hot paths at several database sizes and appends the
+# results to a history file, so each run is compared against the last one
+SUITE_SIZES = [10000, 100000, 1000000]
+DEFAULT_HISTORY = os.path.join(os.path.dirname(DEFAULT_CACHE_DIR), "bench_history.jsonl")
+# Changes smaller than this are timer noise, not regressions
+NOISE_SECONDS = 0.005
+
+def make_scan_tree(folder, file_count):
+    # file_count files over 100-file folders, one in 20 a SQLite database and
+    # the rest page-sized, so the scanner has to read every header
+    filler = b"\0" * 4096
+    for n in range(file_count):
+        subfolder = os.path.join(folder, f"dir{n // 100:04d}")
+        os.makedirs(subfolder, exist_ok=True)
+        path = os.path.join(subfolder, f"file{n:06d}")
+        if n % 20 == 0:
+            conn = sqlite3.connect(path + ".db")
+            conn.execute("CREATE TABLE t (x)")
+            conn.close()
+        else:
+            with open(path + ".bin", "wb") as f:
+                f.write(filler)
+
+def suite_filters(df):
+    filters = empty_filters()
+    filters["search"] = "morning"
+    filters["keyword"] = "good"
+    filters["direction"] = "Sent"
+    filters["start_date"] = str(df['timestamp'].min().date())
+    filters["end_date"] = str(df['timestamp'].quantile(0.75).date())
+    filters["contacts"] = sorted(df['Contact'].dropna().unique())[:5]
+    return filters
+
+def build_media_tab(filtered_df, filters):
+    # What the GUI computes for the Media tab without the count cube
+    media_df = build_media_df(filtered_df, filters["contacts"])
+    counts = media_df['Contact'].value_counts()
+    return media_df, counts[counts > 0]
+
+def best_time(repeat, func, *args):
+    result, best = timed(func, *args)
+    for _ in range(repeat - 1):
+        best = min(best, timed(func, *args)[1])
+    return result, best
+
+def run_suite(sizes, repeat):
+    # {"case@size": best seconds}
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as folder:
+            for schema in ("legacy", "modern"):
+                db_path = make_benchmark_db(folder, size, schema)
+                df, results[f"parse_{schema}@{size}"] = best_time(repeat, parse_db, db_path, "WhatsApp")
+
+            scan_folder = os.path.join(folder, "scan")
+            make_scan_tree(scan_folder, min(max(size // 100, 100), 50000))
+            _, results[f"scan@{size}"] = best_time(repeat, find_sqlite_files, scan_folder)
+
+        filters = suite_filters(df)
+        (filtered_df, _), results[f"filter@{size}"] = best_time(repeat, filter_messages, df, filters)
+        _, results[f"stats@{size}"] = best_time(repeat, compute_stats, df, filters["keyword"])
+        _, results[f"media@{size}"] = best_time(repeat, build_media_tab, df, empty_filters())
+
+        for case in (case for case in results if case.endswith(f"@{size}")):
+            print(f"{case:<24} {results[case]:>9.3f}s", flush=True)
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_history(path):
+    if not os.path.isfile(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def append_history(path, entry):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+def compare_runs(previous, results, max_regression):
+    # Prints each case against the previous run; returns the regressed cases
+    print(f"\ncompared to {previous['commit'] or 'unknown commit'} at {previous['time']}:")
+    regressions = []
+    for case, seconds in results.items():
+        before = previous["results"].get(case)
+        if before is None:
+            continue
+        change = (seconds - before) / before if before else 0.0
+        flag = ""
+        if change > max_regression and seconds - before > NOISE_SECONDS:
+            flag = "  ❌ regression"
+            regressions.append(case)
+        print(f"{case:<24} {before:>9.3f}s -> {seconds:>9.3f}s {change:>+8.1%}{flag}")
+    return regressions
+
+def suite(sizes, repeat, history_path, max_regression):
+    results = run_suite(sizes, repeat)
+    entry = {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "sqlite": sqlite3.sqlite_version,
+        "repeat": repeat,
+        "results": results
+    }
+
+    # Compared against the last run that timed any of the same case@size
+    # keys; compare_runs skips the cases only one of the two runs has
+    previous = [run for run in load_history(history_path) if set(run["results"]) & set(results)]
+    regressions = compare_runs(previous[-1], results, max_regression) if previous else []
+    append_history(history_path, entry)
+    print(f"\nresults appended to {history_path}")
+    return regressions
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark parse_db row normalization and the other hot paths.")
+    arg_parser.add_argument("--rows", type=int, default=1000000)
+    arg_parser.add_argument("--min-speedup", type=float, default=MIN_SPEEDUP,
+                            help=f"exit with an error below this speedup (default: {MIN_SPEEDUP:g}, 0 to only report)")
+    arg_parser.add_argument("--memory", action="store_true", help="report parsed frame memory per column instead")
+    arg_parser.add_argument("--suite", action="store_true", help="time parse, scan, filter, stats and media at --sizes instead")
+    arg_parser.add_argument("--sizes", default=",".join(map(str, SUITE_SIZES)), help="comma-separated message counts for --suite")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="runs per case, the best one counts (default: 3)")
+    arg_parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON lines file the suite results are appended to")
+    arg_parser.add_argument("--max-regression", type=float, default=0.2,
+                            help="exit with an error when a case is this much slower than the previous run (default: 0.2)")
+    args = arg_parser.parse_args()
+
+    if args.memory:
+        memory_report(args.rows)
+        return
+
+    if args.suite:
+        sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+        regressions = suite(sizes, args.repeat, args.history, args.max_regression)
+        if regressions:
+            print(f"❌ Slower than the previous run: {', '.join(regressions)}")
+            sys.exit(1)
+        return
+
+    speedup = run(args.rows)
+    if speedup < args.min_speedup:
+        print(f"❌ Expected at least {args.min_speedup}x speedup")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
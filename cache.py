@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import sqlite3
+import pandas as pd
+from connections import readonly_connection, source_stat
+from diagnostics import traced
+
+# Bump when the parsed DataFrame layout changes so stale entries are ignored
+CACHE_VERSION = 4
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".parsepal", "cache")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# Files making up one cache entry: the frame and its count cube, metadata
+# and search index (the cube is stored as <key>.cube.parquet or .pkl)
+ENTRY_EXTENSIONS = (".parquet", ".pkl", ".json", ".fts")
+
+# Working copies (working_copy.py) and WAL snapshots (connections.py) live in
+# these subdirectories and count toward the same max_bytes
+SCRATCH_DIRS = ("work", "snapshots")
+
+# Files still being written, or SQLite's own while a DB is open
+UNFINISHED_SUFFIXES = (".tmp", "-journal", "-wal", "-shm")
+
+def _has_parquet():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def schema_fingerprint(db_path):
+    with readonly_connection(db_path) as conn:
+        # Every table matters now that the adapter is picked by schema
+        table_info = conn.execute("SELECT type, name, sql FROM sqlite_master WHERE type = 'table' ORDER BY name").fetchall()
+    return hashlib.sha256(repr(table_info).encode("utf-8")).hexdigest()
+
+class ParseCache:
+    # On-disk cache of parsed DataFrames, stored as Parquet when pyarrow is
+    # installed (pickle otherwise) and evicted least-recently-used first,
+    # along with working copies and WAL snapshots, once the cache directory
+    # grows past max_bytes. There is one entry per DB path, app and schema;
+    # a JSON sidecar records the source_stat the frame was parsed at (the
+    # DB's size and mtime, and its WAL's), plus the high-water mark for
+    # incremental refreshes.
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.extension = ".parquet" if _has_parquet() else ".pkl"
+
+    def cache_key(self, db_path, app_name):
+        parts = [
+            str(CACHE_VERSION),
+            app_name.lower(),
+            os.path.abspath(db_path),
+            schema_fingerprint(db_path),
+        ]
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def index_path(self, db_path, app_name):
+        # Where the full-text search index for this entry is kept
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return os.path.join(self.cache_dir, self.cache_key(db_path, app_name) + ".fts")
+
+    def _entry_paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + self.extension, base + ".json"
+
+    def _cube_path(self, key):
+        return os.path.join(self.cache_dir, key + ".cube" + self.extension)
+
+    def _write_frame(self, df, path):
+        tmp_path = path + ".tmp"
+        if self.extension == ".parquet":
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+
+    def _read_frame(self, path):
+        if self.extension == ".parquet":
+            return pd.read_parquet(path)
+        return pd.read_pickle(path)
+
+    def _read_entry(self, db_path, app_name):
+        try:
+            key = self.cache_key(db_path, app_name)
+            stat = source_stat(db_path)
+        except (OSError, sqlite3.Error):
+            return None
+        frame_path, meta_path = self._entry_paths(key)
+        if not os.path.isfile(frame_path) or not os.path.isfile(meta_path):
+            return None
+
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            df = self._read_frame(frame_path)
+        except Exception:
+            # Corrupt or unreadable entry, parse again
+            self._remove(frame_path, meta_path)
+            return None
+
+        # Mark as recently used for LRU eviction
+        os.utime(frame_path)
+        fresh = meta.get("source_stat") == list(stat)
+        return df, meta.get("high_water"), fresh
+
+    @traced("cache.load", rows=lambda entry: 0 if entry is None else len(entry[0]))
+    def load(self, db_path, app_name):
+        # (frame, high_water_mark) if the DB is unchanged since it was
+        # cached, else None
+        entry = self._read_entry(db_path, app_name)
+        if entry is None or not entry[2]:
+            return None
+        return entry[0], entry[1]
+
+    @traced("cache.load_cube", rows=lambda cube: 0 if cube is None else len(cube))
+    def load_cube(self, db_path, app_name):
+        # Count cube (aggregates.build_cube) stored along with the frame
+        # load() returns, None for entries stored without one
+        try:
+            cube_path = self._cube_path(self.cache_key(db_path, app_name))
+            return self._read_frame(cube_path) if os.path.isfile(cube_path) else None
+        except Exception:
+            return None
+
+    def load_for_refresh(self, db_path, app_name):
+        # (frame, high_water_mark) of the last parse even if the DB changed
+        # since, to be passed on to parse_db_incremental. None if not cached.
+        entry = self._read_entry(db_path, app_name)
+        if entry is None:
+            return None
+        return entry[0], entry[1]
+
+    @traced("cache.store")
+    def store(self, db_path, app_name, df, high_water=None, db_stat=None, cube=None):
+        # db_stat is the source_stat() of the DB taken before parsing, so writes
+        # that land while parsing still make the entry stale. cube, the
+        # frame's count cube, is kept with it so a reopen needn't rebuild it.
+        os.makedirs(self.cache_dir, exist_ok=True)
+        stat = db_stat if db_stat is not None else source_stat(db_path)
+        key = self.cache_key(db_path, app_name)
+        frame_path, meta_path = self._entry_paths(key)
+
+        self._write_frame(df, frame_path)
+        if cube is not None:
+            self._write_frame(cube, self._cube_path(key))
+        else:
+            self._remove(self._cube_path(key))
+
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"source_stat": list(stat), "high_water": high_water}, f)
+
+        self.evict()
+
+    def _remove(self, *paths):
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _entries(self):
+        # {name: (last used, total size, paths)}. Files sharing a name up to
+        # the first dot are one entry: a frame with its JSON sidecar and
+        # search index, or a working copy with its conversation summary and
+        # last-used marker.
+        entries = {}
+        directories = [(self.cache_dir, ENTRY_EXTENSIONS)]
+        directories += [(os.path.join(self.cache_dir, name), None) for name in SCRATCH_DIRS]
+        for directory, extensions in directories:
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                if not entry.is_file() or entry.name.endswith(UNFINISHED_SUFFIXES):
+                    continue
+                if extensions is not None and os.path.splitext(entry.name)[1] not in extensions:
+                    continue
+                stat = entry.stat()
+                name = os.path.join(directory, entry.name.split(".", 1)[0])
+                used, size, paths = entries.get(name, (0, 0, []))
+                entries[name] = (max(used, stat.st_mtime), size + stat.st_size, paths + [entry.path])
+        return entries
+
+    def evict(self, keep=()):
+        # Deletes the least recently used entries, working copies and WAL
+        # snapshots included, until they fit in max_bytes. Entries with a
+        # file in keep (the working copy about to be used) are left alone.
+        keep = {os.path.abspath(path) for path in keep}
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries.values())
+        for _, size, paths in sorted(entries.values(), key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            if keep.intersection(os.path.abspath(path) for path in paths):
+                continue
+            try:
+                self._remove(*paths)
+            except OSError:
+                # Still open elsewhere (Windows), try again next time
+                continue
+            total -= size
+
+    def clear(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith((".parquet", ".pkl", ".json", ".fts", ".tmp")):
+                os.remove(entry.path)
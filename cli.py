@@ -0,0 +1,244 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Heavy modules (pandas, the parser) are imported inside the commands, so
+# `--help` and argument errors return without loading them, and nothing here
+# ever imports tkinter.
+
+FORMATS = ("csv", "jsonl", "parquet")
+
+class ExportWriter:
+    # Appends parsed chunks to a CSV, JSONL or Parquet output one at a time,
+    # so memory is bounded by the chunk size rather than the export size.
+    # path "-" writes CSV/JSONL to stdout. CSV part files for parallel exports
+    # are written without a header.
+
+    def __init__(self, path, fmt, columns, header=True):
+        self.path = path
+        self.fmt = fmt
+        self.columns = columns
+        self.rows = 0
+        self.parquet_writer = None
+        if fmt == "parquet":
+            if path == "-":
+                raise RuntimeError("Parquet output needs a file, not stdout")
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)")
+            types = {"timestamp": pa.timestamp("us"), "message_id": pa.int64()}
+            self.schema = pa.schema([(col, types.get(col, pa.string())) for col in columns])
+            self.parquet_writer = pq.ParquetWriter(path, self.schema)
+            self.stream = None
+        else:
+            self.stream = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="")
+            if fmt == "csv" and header:
+                self.stream.write(",".join(columns) + "\n")
+
+    def write(self, df):
+        if df.empty:
+            return
+        df = df[self.columns]
+        if self.fmt == "csv":
+            df.to_csv(self.stream, header=False, index=False, lineterminator="\n")
+        elif self.fmt == "jsonl":
+            self.stream.write(df.to_json(orient="records", lines=True, date_format="iso", force_ascii=False))
+        else:
+            import pyarrow as pa
+            self.parquet_writer.write_table(pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+        self.rows += len(df)
+
+    def append_part(self, part_path):
+        # Copies a part file written by a parallel worker onto the output
+        if self.fmt == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            for batch in pq.ParquetFile(part_path).iter_batches():
+                self.parquet_writer.write_table(pa.Table.from_batches([batch], schema=self.schema))
+        else:
+            with open(part_path, "r", encoding="utf-8", newline="") as part:
+                shutil.copyfileobj(part, self.stream)
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        elif self.stream is not sys.stdout:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+def export_columns():
+    from parser import OUTPUT_COLUMNS
+    return OUTPUT_COLUMNS + ["source_db"]
+
+def export_one(db_path, app_name, filters, writer, chunk_size):
+    # Streams one DB through writer, filters applied in SQL. Returns (rows, error).
+    from parser import iter_parse_db
+    from diagnostics import span
+    rows = 0
+    with span("export", db=db_path) as fields:
+        try:
+            for chunk in iter_parse_db(db_path, app_name, chunk_size=chunk_size, filters=filters):
+                with span("write", rows=len(chunk)):
+                    writer.write(chunk.assign(source_db=db_path))
+                rows += len(chunk)
+        except Exception as e:
+            fields["error"] = str(e)
+            return rows, str(e)
+        finally:
+            fields["rows"] = rows
+    return rows, None
+
+def export_part(db_path, app_name, filters, fmt, part_path, chunk_size):
+    # Runs in a worker process: exports one DB to its own part file
+    start = time.perf_counter()
+    writer = ExportWriter(part_path, fmt, export_columns(), header=False)
+    try:
+        rows, error = export_one(db_path, app_name, filters, writer, chunk_size)
+    finally:
+        writer.close()
+    return {"source_db": db_path, "rows": rows, "seconds": time.perf_counter() - start, "error": error}
+
+def collect_databases(paths, exclude, max_depth, app_name, quiet):
+    # Files are taken as given, folders are scanned for SQLite databases.
+    # When detecting apps, scanned databases no adapter recognizes are skipped.
+    from utils import find_sqlite_files
+    from adapters import is_auto, detect_app
+    db_paths = []
+    for path in paths:
+        if not os.path.isdir(path):
+            db_paths.append(path)
+            continue
+        for db_path in find_sqlite_files(path, exclude=exclude, max_depth=max_depth):
+            if is_auto(app_name) and detect_app(db_path) is None:
+                if not quiet:
+                    print(f"{db_path}: skipped, no app recognized", file=sys.stderr)
+                continue
+            db_paths.append(db_path)
+    return list(dict.fromkeys(db_paths))
+
+def build_filters(args):
+    from filters import empty_filters, parse_date_filters
+    filters = empty_filters()
+    filters["search"] = args.search or ""
+    filters["match"] = args.match
+    filters["direction"] = args.direction
+    filters["start_date"] = args.start_date or ""
+    filters["end_date"] = args.end_date or ""
+    filters["contacts"] = args.contact or []
+    if parse_date_filters(filters)[2]:
+        raise RuntimeError("Dates must be in a format like YYYY-MM-DD")
+    return filters
+
+def report(result, quiet):
+    if quiet:
+        return
+    if result["error"]:
+        print(f"{result['source_db']}: error: {result['error']}", file=sys.stderr)
+    else:
+        print(f"{result['source_db']}: {result['rows']} rows in {result['seconds']:.2f}s", file=sys.stderr)
+
+def run_export(args):
+    filters = build_filters(args)
+    db_paths = collect_databases(args.paths, args.exclude, args.max_depth, args.app, args.quiet)
+    if not db_paths:
+        raise RuntimeError("No databases found")
+
+    writer = ExportWriter(args.output, args.format, export_columns())
+    results = []
+    try:
+        if args.workers <= 1 or len(db_paths) == 1:
+            for db_path in db_paths:
+                start = time.perf_counter()
+                rows, error = export_one(db_path, args.app, filters, writer, args.chunk_size)
+                results.append({"source_db": db_path, "rows": rows, "seconds": time.perf_counter() - start, "error": error})
+                report(results[-1], args.quiet)
+        else:
+            # Every DB is streamed to its own part file in a worker process, and
+            # the parts are appended to the output in input order
+            from batch import process_pool
+            with tempfile.TemporaryDirectory(prefix="parsepal-") as part_dir, \
+                    process_pool(args.workers) as executor:
+                futures = [
+                    executor.submit(export_part, db_path, args.app, filters, args.format,
+                                    os.path.join(part_dir, f"{i}.{args.format}"), args.chunk_size)
+                    for i, db_path in enumerate(db_paths)
+                ]
+                for i, future in enumerate(futures):
+                    results.append(future.result())
+                    writer.append_part(os.path.join(part_dir, f"{i}.{args.format}"))
+                    report(results[-1], args.quiet)
+    finally:
+        writer.close()
+
+    failed = sum(1 for result in results if result["error"])
+    if not args.quiet:
+        total = sum(result["rows"] for result in results)
+        print(f"Exported {total} rows from {len(results) - failed} of {len(results)} databases", file=sys.stderr)
+    return 1 if failed else 0
+
+def run_scan(args):
+    from utils import scan_sqlite_files, format_db_summary
+    for info in scan_sqlite_files(args.folder, exclude=args.exclude, max_depth=args.max_depth):
+        print(format_db_summary(info))
+    return 0
+
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser(prog="parsepal", description="Parse messaging app databases without the GUI.")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    scan_options = argparse.ArgumentParser(add_help=False)
+    scan_options.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                              help="skip files and folders matching this pattern (repeatable)")
+    scan_options.add_argument("--max-depth", type=int, default=None, help="folder levels to descend when scanning")
+    scan_options.add_argument("--trace", metavar="FILE",
+                              help="write a JSON trace of the time spent per stage (not including -j worker processes)")
+    scan_options.add_argument("--profile", action="store_true", help="add a cProfile summary to the --trace file")
+    scan_options.add_argument("--trace-memory", action="store_true", help="add tracemalloc peaks to the --trace file")
+
+    export = commands.add_parser("export", parents=[scan_options], help="parse databases and write the messages out")
+    export.add_argument("paths", nargs="+", help="database files, or folders to scan for databases")
+    export.add_argument("-o", "--output", default="-", help="output file, '-' for stdout (default)")
+    export.add_argument("-f", "--format", choices=FORMATS, default=None, help="output format (default: from the output extension, else csv)")
+    export.add_argument("--app", default="auto", help="app preset, e.g. WhatsApp (default: detect per database)")
+    export.add_argument("--search", help="only messages containing this text")
+    export.add_argument("--match", choices=("Substring", "Words"), default="Substring",
+                        help="match --search as a substring (default) or as tokens, prefix* and \"phrases\"")
+    export.add_argument("--direction", choices=("All", "Sent", "Received"), default="All")
+    export.add_argument("--start-date", help="only messages on or after this date (YYYY-MM-DD)")
+    export.add_argument("--end-date", help="only messages on or before this date (YYYY-MM-DD)")
+    export.add_argument("--contact", action="append", help="only messages with this contact (repeatable)")
+    export.add_argument("-j", "--workers", type=int, default=1, help="databases parsed in parallel (default: 1)")
+    export.add_argument("--chunk-size", type=int, default=50000, help="rows read per chunk (default: 50000)")
+    export.add_argument("-q", "--quiet", action="store_true", help="don't print per-database progress")
+
+    scan = commands.add_parser("scan", parents=[scan_options], help="list the SQLite databases under a folder")
+    scan.add_argument("folder")
+    return arg_parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if args.command == "export" and args.format is None:
+        extension = os.path.splitext(args.output)[1].lstrip(".").lower()
+        args.format = extension if extension in FORMATS else "csv"
+    if args.trace:
+        from diagnostics import TRACER
+        TRACER.set_capture(profile=args.profile, memory=args.trace_memory)
+    try:
+        if args.command == "export":
+            return run_export(args)
+        return run_scan(args)
+    except RuntimeError as e:
+        print(f"parsepal: error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if args.trace:
+            TRACER.export(args.trace)
+
+if __name__ == "__main__":
+    sys.exit(main())
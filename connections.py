@@ -0,0 +1,174 @@
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+# Evidence DBs are only ever opened read-only and immutable, so SQLite never
+# writes or creates anything next to them. Pages are memory-mapped so reads
+# come straight from the OS page cache, with a bigger page cache for what
+# isn't mapped.
+DEFAULT_MMAP_SIZE = 256 * 1024 ** 2
+DEFAULT_CACHE_KIB = 64 * 1024
+
+# Private copies of WAL-backed DBs, next to the parse cache (cache.py)
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.expanduser("~"), ".parsepal", "cache", "snapshots")
+
+def _has_wal(db_path):
+    try:
+        return os.path.getsize(db_path + "-wal") > 0
+    except OSError:
+        return False
+
+def source_stat(db_path):
+    # Size and mtime of the DB, plus its WAL sidecar's when it has one
+    stat = os.stat(db_path)
+    key = (stat.st_size, stat.st_mtime_ns)
+    if _has_wal(db_path):
+        wal = os.stat(db_path + "-wal")
+        key += (wal.st_size, wal.st_mtime_ns)
+    return key
+
+def readonly_uri(db_path):
+    # immutable=1 skips locking and change detection entirely, so nothing
+    # (no -shm, no journal) is ever created next to the file
+    return f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro&immutable=1"
+
+def open_schema_probe(db_path):
+    # Plain immutable connection for reading sqlite_master only. A probe
+    # doesn't need the WAL's recent rows, so it skips the snapshot that
+    # open_readonly makes of WAL-backed DBs.
+    return sqlite3.connect(readonly_uri(db_path), uri=True, check_same_thread=False)
+
+def wal_snapshot(db_path, snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+    # Recent messages of a WAL-backed DB live in its -wal sidecar, which
+    # immutable=1 would ignore, and reading the WAL in place makes SQLite
+    # create a -shm file in the evidence folder (or fail on a read-only
+    # mount). The DB and its -wal are copied into snapshot_dir instead and
+    # the copy is checkpointed into a single file. A snapshot is reused while
+    # both source files are unchanged; snapshots of older versions are left
+    # to the parse cache's eviction (cache.py), as another thread may still
+    # be reading one.
+    os.makedirs(snapshot_dir, exist_ok=True)
+    prefix = hashlib.sha256(os.path.abspath(db_path).encode("utf-8")).hexdigest()
+    version = hashlib.sha256(repr(source_stat(db_path)).encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(snapshot_dir, f"{prefix}-{version}.db")
+    if os.path.isfile(path):
+        # Mark as recently used for the parse cache's LRU eviction
+        os.utime(path)
+        return path
+
+    # A unique temporary name, so two threads snapshotting the same DB don't
+    # write over each other's copy
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=snapshot_dir)
+    os.close(fd)
+    try:
+        shutil.copyfile(db_path, tmp_path)
+        shutil.copyfile(db_path + "-wal", tmp_path + "-wal")
+        conn = sqlite3.connect(tmp_path)
+        try:
+            # Leaving WAL mode checkpoints the copied WAL into the copy
+            conn.execute("PRAGMA journal_mode = DELETE").fetchone()
+        finally:
+            conn.close()
+        os.replace(tmp_path, path)
+    finally:
+        for leftover in (tmp_path, tmp_path + "-wal", tmp_path + "-shm"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return path
+
+def _contains(text, needle):
+    # SQL twin of filters.contains_text, for searches LIKE can't case-fold
+    return isinstance(text, str) and needle in text.lower()
+
+def _regexp(text, pattern):
+    # SQL twin of filters.matches_words, one part at a time
+    return isinstance(text, str) and re.search(pattern, text.lower()) is not None
+
+def open_readonly(db_path, mmap_size=DEFAULT_MMAP_SIZE, cache_kib=DEFAULT_CACHE_KIB):
+    if _has_wal(db_path):
+        db_path = wal_snapshot(db_path)
+    conn = sqlite3.connect(readonly_uri(db_path), uri=True, check_same_thread=False)
+    conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+    conn.execute(f"PRAGMA cache_size = -{int(cache_kib)}")
+    conn.execute("PRAGMA query_only = 1")
+    conn.create_function("parsepal_contains", 2, _contains, deterministic=True)
+    conn.create_function("parsepal_regexp", 2, _regexp, deterministic=True)
+    return conn
+
+class ConnectionPool:
+    # Idle read-only connections kept per database, so repeated queries in a
+    # session (filter changes, refreshes) reuse a warm page cache. Connections
+    # are keyed by the file's (and its WAL's) size and mtime: an immutable
+    # connection must not outlive changes to the file, so a changed file gets
+    # new connections.
+    # A connection is used by one thread at a time, between checkout and checkin.
+
+    def __init__(self, max_idle=4, max_databases=16):
+        self.max_idle = max_idle
+        self.max_databases = max_databases
+        self.lock = threading.Lock()
+        self.idle = OrderedDict()
+
+    def _key(self, db_path):
+        return (os.path.abspath(db_path),) + source_stat(db_path)
+
+    def checkout(self, db_path):
+        key = self._key(db_path)
+        stale = []
+        with self.lock:
+            # Connections to an older version of the same file are useless now
+            for other in [other for other in self.idle if other[0] == key[0] and other != key]:
+                stale.extend(self.idle.pop(other))
+            conns = self.idle.get(key)
+            conn = conns.pop() if conns else None
+            if conns is not None:
+                self.idle.move_to_end(key)
+        for old in stale:
+            old.close()
+        return key, conn if conn is not None else open_readonly(db_path)
+
+    def checkin(self, key, conn):
+        evicted = []
+        with self.lock:
+            conns = self.idle.setdefault(key, [])
+            self.idle.move_to_end(key)
+            if len(conns) < self.max_idle:
+                conns.append(conn)
+            else:
+                evicted.append(conn)
+            while len(self.idle) > self.max_databases:
+                evicted.extend(self.idle.popitem(last=False)[1])
+        for old in evicted:
+            old.close()
+
+    @contextmanager
+    def connection(self, db_path):
+        key, conn = self.checkout(db_path)
+        try:
+            yield conn
+        except BaseException:
+            # Don't hand out a connection left in an unknown state (or with a
+            # statement still running, when a parse generator was closed early)
+            conn.close()
+            raise
+        self.checkin(key, conn)
+
+    def close_all(self):
+        with self.lock:
+            conns = [conn for idle in self.idle.values() for conn in idle]
+            self.idle.clear()
+        for conn in conns:
+            conn.close()
+
+POOL = ConnectionPool()
+
+def readonly_connection(db_path):
+    # with readonly_connection(path) as conn: ... on a pooled read-only connection
+    return POOL.connection(db_path)
@@ -0,0 +1,134 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from parser import _build_query, _select_list, _normalize_rows, _normalize_timestamps
+from filters import sql_filter_clause
+from adapters import AUTO_DETECT
+from connections import readonly_connection
+from diagnostics import traced
+
+# Chats are listed from one GROUP BY over the message rows, and a chat's
+# messages are only read when it is opened, a page at a time. Pages are
+# fetched by keyset pagination on (timestamp, id): each page continues after
+# the last row of the previous one, so every page is an index range scan on
+# the working copy's (contact, timestamp) index however deep the chat is.
+
+DEFAULT_PAGE_SIZE = 200
+
+CONVERSATION_COLUMNS = ["Contact", "messages", "media", "last_message"]
+
+def _media_expression(projection):
+    # SQL twin of filters.has_media on media_name, falling back to media_url
+    if "media_name" in projection and "media_url" in projection:
+        name = projection["media_name"]
+        path = f"(CASE WHEN {name} IS NOT NULL AND {name} != '' THEN {name} ELSE {projection['media_url']} END)"
+    elif "media_name" in projection or "media_url" in projection:
+        path = projection.get("media_name", projection.get("media_url"))
+    else:
+        return "0"
+    return f"({path} IS NOT NULL AND TRIM({path}) != '' AND lower({path}) != 'none')"
+
+def _load_summary(summary_path, key):
+    try:
+        with open(summary_path, "rb") as f:
+            stored_key, conversations = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+        return None
+    return conversations if stored_key == key else None
+
+def _store_summary(summary_path, key, conversations):
+    tmp_path = summary_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump((key, conversations), f)
+    os.replace(tmp_path, summary_path)
+
+@traced("conversations", rows=len)
+def list_conversations(db_path, app_name=AUTO_DETECT, filters=None, summary_path=None):
+    # One row per chat with its message and media counts and the time of its
+    # last message, most recently active first. filters as in parse_db.
+    # The GROUP BY reads every message, so with summary_path the unfiltered
+    # list is kept there and reused while db_path is unchanged.
+    stat = os.stat(db_path)
+    key = (stat.st_size, stat.st_mtime_ns, str(app_name).lower())
+    try:
+        with readonly_connection(db_path) as conn:
+            cursor = conn.cursor()
+            query = _build_query(cursor, app_name, filters=filters)
+            projection = query["projection"]
+            filtered = filters is not None and sql_filter_clause(filters, projection)[0] is not None
+            if summary_path is not None and not filtered:
+                conversations = _load_summary(summary_path, key)
+                if conversations is not None:
+                    return conversations
+
+            # "+" keeps SQLite from walking the contact index in order, which
+            # costs a table lookup per message; one scan and a sort is faster
+            contact = projection.get("contact", "NULL")
+            last = f"MAX({projection['timestamp']})" if "timestamp" in projection else "NULL"
+            cursor.execute(
+                f"SELECT {contact}, COUNT(*), SUM({_media_expression(projection)}), {last} "
+                f"FROM {query['from']} WHERE {query['where']} GROUP BY +{contact}",
+                query["params"]
+            )
+            rows = cursor.fetchall()
+    except Exception as e:
+        raise RuntimeError(f"Error parsing DB: {e}")
+
+    last_raw = np.fromiter((row[3] for row in rows), dtype=object, count=len(rows))
+    conversations = pd.DataFrame({
+        "Contact": pd.Series([row[0] for row in rows], dtype=object),
+        "messages": np.fromiter((row[1] for row in rows), dtype="int64", count=len(rows)),
+        "media": np.fromiter((row[2] or 0 for row in rows), dtype="int64", count=len(rows)),
+        "last_message": _normalize_timestamps({"timestamp": last_raw}, len(rows)),
+    }, columns=CONVERSATION_COLUMNS)
+    conversations = conversations.sort_values("last_message", ascending=False, na_position="last", kind="stable")
+    conversations = conversations.reset_index(drop=True)
+    if summary_path is not None and not filtered:
+        _store_summary(summary_path, key, conversations)
+    return conversations
+
+def _page_sql(query, contact, after):
+    # Rows of the chat after the `after` cursor, in (timestamp, id) order.
+    # NULL timestamps sort first, so a cursor inside them continues by id.
+    projection = query["projection"]
+    row_id = projection["id"]
+    where = f"({query['where']}) AND {query['adapter'].chat_clause(projection, contact)}"
+    params = [contact]
+    if "timestamp" not in projection:
+        order = f"{row_id} ASC"
+        if after is not None:
+            where += f" AND {row_id} > ?"
+            params.append(after[1])
+    else:
+        timestamp = projection["timestamp"]
+        order = f"{timestamp} ASC, {row_id} ASC"
+        if after is not None and after[0] is None:
+            where += f" AND ({timestamp} IS NOT NULL OR {row_id} > ?)"
+            params.append(after[1])
+        elif after is not None:
+            where += f" AND ({timestamp}, {row_id}) > (?, ?)"
+            params.extend(after)
+    return f"SELECT {_select_list(projection)} FROM {query['from']} WHERE {where} ORDER BY {order} LIMIT ?", params
+
+@traced("conversation_page", rows=lambda page: len(page[0]))
+def fetch_conversation_page(db_path, app_name, contact, after=None, page_size=DEFAULT_PAGE_SIZE, filters=None):
+    # Returns (frame, cursor) for the next page_size messages of one chat,
+    # oldest first. Pass cursor as `after` to get the page after this one;
+    # it is None once the chat has no more messages.
+    try:
+        with readonly_connection(db_path) as conn:
+            cursor = conn.cursor()
+            query = _build_query(cursor, app_name, filters=filters)
+            sql, params = _page_sql(query, contact, after)
+            cursor.execute(sql, query["params"] + params + [page_size])
+            selected_cols = [description[0] for description in cursor.description]
+            rows = cursor.fetchall()
+    except Exception as e:
+        raise RuntimeError(f"Error parsing DB: {e}")
+
+    next_cursor = None
+    if len(rows) == page_size:
+        last = dict(zip(selected_cols, rows[-1]))
+        next_cursor = (last.get("timestamp"), last["id"])
+    return _normalize_rows(selected_cols, rows), next_cursor
@@ -0,0 +1,223 @@
+import cProfile
+import functools
+import json
+import os
+import platform
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is left out there
+    resource = None
+
+MAX_SPANS = 20000
+
+def _peak_rss():
+    # Process high-water mark in bytes (ru_maxrss is KiB on Linux, bytes on macOS)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class Tracer:
+    # Records a span for each pipeline stage (SQL, normalization, filtering,
+    # Treeview updates...) with its wall time, thread, row count and peak
+    # memory, so a slow case can be diagnosed from an exported trace.
+    # Capture mode adds a cProfile of every outermost span and tracemalloc
+    # peaks per span; tracemalloc counts the whole process, so spans running
+    # at the same time on other threads show up in each other's peaks.
+
+    def __init__(self, max_spans=MAX_SPANS):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.spans = deque(maxlen=max_spans)
+        self.origin = time.perf_counter()
+        self.profiling = False
+        self.profile_stats = None
+
+    @property
+    def tracing_memory(self):
+        return tracemalloc.is_tracing()
+
+    def set_capture(self, profile=False, memory=False):
+        self.profiling = profile
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def clear(self):
+        with self.lock:
+            self.spans.clear()
+            self.profile_stats = None
+
+    def _start_profile(self):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active (e.g. one per process on Python 3.12+)
+            return None
+        return profile
+
+    def _merge_profile(self, profile):
+        profile.disable()
+        with self.lock:
+            if self.profile_stats is None:
+                self.profile_stats = pstats.Stats(profile)
+            else:
+                self.profile_stats.add(profile)
+
+    @contextmanager
+    def span(self, name, **fields):
+        # with span("filter", rows=len(df)) as fields: ... fields["rows"] = n
+        # Extra fields are kept with the span and exported as its args.
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        profile = self._start_profile() if self.profiling and not stack else None
+
+        # A nested span resets the tracemalloc peak, so the peak reached so far
+        # is carried up to the spans that enclose it
+        memory = tracemalloc.is_tracing()
+        if memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+        frame = {"peak": 0, "current": current if memory else 0}
+        stack.append(frame)
+
+        start = time.perf_counter()
+        error = None
+        try:
+            yield fields
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+            if profile is not None:
+                self._merge_profile(profile)
+            record = {
+                "name": name,
+                "thread": threading.current_thread().name,
+                "thread_id": threading.get_ident(),
+                "start": start - self.origin,
+                "seconds": seconds,
+                "depth": len(stack),
+                "peak_rss": _peak_rss(),
+            }
+            if memory and tracemalloc.is_tracing():
+                peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+                record["peak_traced"] = peak - frame["current"]
+                if stack:
+                    stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+            if error is not None:
+                record["error"] = error
+            record.update(fields)
+            with self.lock:
+                self.spans.append(record)
+
+    def recent(self, limit=None):
+        with self.lock:
+            spans = list(self.spans)
+        return spans if limit is None else spans[-limit:]
+
+    def summary(self):
+        # Per stage: count, total and max seconds, rows and peak memory
+        stages = {}
+        for record in self.recent():
+            stage = stages.setdefault(record["name"], {"name": record["name"], "count": 0, "seconds": 0.0,
+                                                       "max_seconds": 0.0, "rows": 0, "peak_traced": None})
+            stage["count"] += 1
+            stage["seconds"] += record["seconds"]
+            stage["max_seconds"] = max(stage["max_seconds"], record["seconds"])
+            if isinstance(record.get("rows"), int):
+                stage["rows"] += record["rows"]
+            if record.get("peak_traced") is not None:
+                stage["peak_traced"] = max(stage["peak_traced"] or 0, record["peak_traced"])
+        return sorted(stages.values(), key=lambda stage: stage["seconds"], reverse=True)
+
+    def profile_rows(self, limit=40):
+        # Functions with the most cumulative time in the profiled spans
+        with self.lock:
+            if self.profile_stats is None:
+                return []
+            entries = list(self.profile_stats.stats.items())
+        rows = []
+        for (filename, line, function), (_, calls, own, cumulative, _) in entries:
+            rows.append({
+                "function": f"{function} ({os.path.basename(filename)}:{line})",
+                "calls": calls,
+                "own_seconds": own,
+                "cumulative_seconds": cumulative,
+            })
+        rows.sort(key=lambda row: row["cumulative_seconds"], reverse=True)
+        return rows[:limit]
+
+    def trace(self):
+        # Chrome trace event format, so an export also opens in
+        # chrome://tracing or Perfetto next to the raw spans
+        pid = os.getpid()
+        records = self.recent()
+        threads = {record["thread_id"]: record["thread"] for record in records}
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread}}
+                  for tid, thread in threads.items()]
+        for record in records:
+            args = {key: value for key, value in record.items()
+                    if key not in ("name", "thread", "thread_id", "start", "seconds")}
+            events.append({
+                "name": record["name"],
+                "cat": "parsepal",
+                "ph": "X",
+                "ts": round(record["start"] * 1e6),
+                "dur": round(record["seconds"] * 1e6),
+                "pid": pid,
+                "tid": record["thread_id"],
+                "args": args,
+            })
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "argv": sys.argv,
+                "profiling": self.profiling,
+                "tracing_memory": self.tracing_memory,
+                "summary": self.summary(),
+                "profile": self.profile_rows(),
+            },
+        }
+
+    def export(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.trace(), f, default=str)
+
+TRACER = Tracer()
+
+def span(name, **fields):
+    # with span("stage") as fields: ... on the shared tracer
+    return TRACER.span(name, **fields)
+
+def traced(name, rows=None):
+    # Decorator running the function in a span; rows(result) is its row count
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with TRACER.span(name) as fields:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    fields["rows"] = int(rows(result))
+                return result
+        return wrapper
+    return decorate
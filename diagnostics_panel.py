@@ -0,0 +1,88 @@
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox
+
+RECENT_SPANS = 300
+
+def _mb(value):
+    return "" if value is None else f"{value / 1024 ** 2:.1f}"
+
+class DiagnosticsPanel(ttk.Frame):
+    # Shows what a Tracer has recorded: time per stage, the latest spans and,
+    # with profiling on, the functions the profiled spans spent their time in.
+    # The trace can be saved as JSON and attached to a bug report.
+
+    def __init__(self, master, tracer):
+        super().__init__(master)
+        self.tracer = tracer
+        self.profile_var = tk.BooleanVar(value=tracer.profiling)
+        self.memory_var = tk.BooleanVar(value=tracer.tracing_memory)
+
+        controls = ttk.Frame(self)
+        controls.pack(fill="x", pady=(0, 5))
+        ttk.Checkbutton(controls, text="Profile (cProfile)", variable=self.profile_var,
+                        command=self.on_capture_change).pack(side="left", padx=5)
+        ttk.Checkbutton(controls, text="Track memory (tracemalloc)", variable=self.memory_var,
+                        command=self.on_capture_change).pack(side="left", padx=5)
+        ttk.Button(controls, text="Refresh", command=self.refresh).pack(side="left", padx=5)
+        ttk.Button(controls, text="Clear", command=self.clear).pack(side="left", padx=5)
+        ttk.Button(controls, text="Export JSON...", command=self.export).pack(side="left", padx=5)
+
+        panes = ttk.PanedWindow(self, orient="vertical")
+        panes.pack(fill="both", expand=True)
+        self.stage_tree = self._add_table(panes, "Time per stage", (
+            ("Stage", 160), ("Count", 60), ("Total s", 80), ("Max s", 80), ("Rows", 90), ("Peak MB", 80)))
+        self.span_tree = self._add_table(panes, "Recent spans", (
+            ("Stage", 160), ("Thread", 140), ("ms", 80), ("Rows", 90), ("Peak MB", 80), ("RSS MB", 80), ("Details", 300)))
+        self.profile_tree = self._add_table(panes, "Profile (cumulative time)", (
+            ("Function", 420), ("Calls", 80), ("Own s", 80), ("Cumulative s", 100)))
+
+    def _add_table(self, panes, title, columns):
+        frame = ttk.LabelFrame(panes, text=title)
+        tree = ttk.Treeview(frame, columns=[name for name, _ in columns], show="headings", height=6)
+        for name, width in columns:
+            tree.heading(name, text=name)
+            tree.column(name, width=width, anchor="w")
+        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        panes.add(frame, weight=1)
+        return tree
+
+    def on_capture_change(self):
+        self.tracer.set_capture(profile=self.profile_var.get(), memory=self.memory_var.get())
+
+    def refresh(self):
+        for tree in (self.stage_tree, self.span_tree, self.profile_tree):
+            tree.delete(*tree.get_children())
+
+        for stage in self.tracer.summary():
+            self.stage_tree.insert("", "end", values=(
+                stage["name"], stage["count"], f"{stage['seconds']:.3f}", f"{stage['max_seconds']:.3f}",
+                stage["rows"] or "", _mb(stage["peak_traced"])))
+
+        # Newest first
+        known = ("name", "thread", "thread_id", "start", "seconds", "depth", "rows", "peak_traced", "peak_rss")
+        for record in reversed(self.tracer.recent(RECENT_SPANS)):
+            details = ", ".join(f"{key}={value}" for key, value in record.items() if key not in known)
+            self.span_tree.insert("", "end", values=(
+                "  " * record["depth"] + record["name"], record["thread"], f"{record['seconds'] * 1000:.1f}",
+                record.get("rows", ""), _mb(record.get("peak_traced")), _mb(record.get("peak_rss")), details))
+
+        for row in self.tracer.profile_rows():
+            self.profile_tree.insert("", "end", values=(
+                row["function"], row["calls"], f"{row['own_seconds']:.3f}", f"{row['cumulative_seconds']:.3f}"))
+
+    def clear(self):
+        self.tracer.clear()
+        self.refresh()
+
+    def export(self):
+        path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON trace", "*.json")],
+                                            initialfile="parsepal-trace.json")
+        if not path:
+            return
+        try:
+            self.tracer.export(path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not write trace: {e}")
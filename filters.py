@@ -0,0 +1,242 @@
+import re
+import numpy as np
+import pandas as pd
+from diagnostics import traced
+from search_index import WORD, parse_word_query, word_pattern
+
+# How the search text and stats keyword are matched: "Substring" finds the
+# text anywhere, "Words" takes tokens, prefix* and "phrase" queries
+MATCH_MODES = ("Substring", "Words")
+
+def empty_filters():
+    return {
+        "search": "",
+        "keyword": "",
+        "match": "Substring",
+        "direction": "All",
+        "start_date": "",
+        "end_date": "",
+        "contacts": []
+    }
+
+def _index_matches(search_index, df):
+    # The index can only answer for the exact frame it was built from
+    return search_index is not None and search_index.row_count == len(df)
+
+def contains_text(messages, text):
+    # "Substring" search everywhere (scan, full-text index, SQL) is a
+    # literal, case-insensitive substring match; text is already lowercase
+    return messages.str.lower().str.contains(text, regex=False, na=False)
+
+def matches_words(messages, parts):
+    # "Words" search: rows matching every search_index.parse_word_query part
+    lowered = messages.str.lower()
+    mask = pd.Series(True, index=messages.index)
+    for tokens, prefix in parts:
+        mask &= lowered.str.contains(word_pattern(tokens, prefix), regex=True, na=False)
+    return mask
+
+def _keyword_part(keyword):
+    # A "Words" keyword is counted as one token, prefix* or phrase
+    return tuple(WORD.findall(keyword.lower())), keyword.strip().endswith("*")
+
+def parse_date_filters(filters):
+    # Returns (start, end, date_error). Parsing stops at the first bad date.
+    start_dt = end_dt = None
+    try:
+        if filters["start_date"]:
+            start_dt = pd.to_datetime(filters["start_date"])
+        if filters["end_date"]:
+            end_dt = pd.to_datetime(filters["end_date"])
+    except Exception:
+        return start_dt, None, True
+    return start_dt, end_dt, False
+
+def _timestamp_clause(timestamp, op, dt):
+    # Raw timestamps are ms since epoch above 1e12 and seconds above 1e9,
+    # matching how parse_db normalizes them
+    seconds = (dt - pd.Timestamp("1970-01-01")) / pd.Timedelta(seconds=1)
+    clause = (
+        f"(typeof({timestamp}) IN ('integer', 'real') AND ("
+        f"({timestamp} > 1e12 AND {timestamp} {op} ?) OR "
+        f"({timestamp} > 1e9 AND {timestamp} <= 1e12 AND {timestamp} {op} ?)))"
+    )
+    return clause, [seconds * 1000, seconds]
+
+def sql_filter_clause(filters, projection):
+    # Translates the filter state into a parameterized WHERE fragment over an
+    # adapter's projection (logical column -> SQL expression, see adapters.py).
+    # Returns (sql, params); sql is None without filters.
+    clauses = []
+    params = []
+
+    search_text = filters["search"].lower()
+    if search_text:
+        if "text" not in projection:
+            return "0", []
+        if filters["match"] == "Words":
+            # Registered on every connection by connections.open_readonly
+            for tokens, prefix in parse_word_query(search_text):
+                clauses.append(f"parsepal_regexp({projection['text']}, ?)")
+                params.append(word_pattern(tokens, prefix))
+        elif search_text.isascii():
+            # LIKE only folds ASCII case, which is all an ASCII search needs
+            escaped = search_text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            clauses.append(f"{projection['text']} LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+        else:
+            # Registered on every connection by connections.open_readonly
+            clauses.append(f"parsepal_contains({projection['text']}, ?)")
+            params.append(search_text)
+
+    direction = filters["direction"]
+    if direction != "All":
+        if "from_me" not in projection:
+            return "0", []
+        from_me = projection["from_me"]
+        if direction == "Sent":
+            clauses.append(f"{from_me} = 1")
+        else:
+            clauses.append(f"({from_me} IS NULL OR {from_me} != 1)")
+
+    start_dt, end_dt, _ = parse_date_filters(filters)
+    for op, dt in ((">=", start_dt), ("<=", end_dt)):
+        if dt is None:
+            continue
+        if "timestamp" not in projection:
+            return "0", []
+        clause, clause_params = _timestamp_clause(projection["timestamp"], op, dt)
+        clauses.append(clause)
+        params.extend(clause_params)
+
+    if filters["contacts"]:
+        if "contact" not in projection:
+            return "0", []
+        clauses.append(f"{projection['contact']} IN ({', '.join('?' * len(filters['contacts']))})")
+        params.extend(filters["contacts"])
+
+    if not clauses:
+        return None, []
+    return " AND ".join(clauses), params
+
+@traced("filter", rows=lambda result: len(result[0]))
+def filter_messages(df, filters, search_index=None):
+    # Returns (filtered frame, date_error). A malformed date skips the date
+    # filter and sets date_error instead of failing the whole filter.
+    df_filtered = df
+
+    # Search message text; once the full-text index is built it narrows
+    # down the rows to check
+    search_text = filters["search"].lower()
+    if search_text and filters["match"] == "Words":
+        parts = parse_word_query(search_text)
+        if parts and _index_matches(search_index, df):
+            df_filtered = df_filtered.iloc[search_index.search(parts)]
+        if parts:
+            df_filtered = df_filtered[matches_words(df_filtered['Message'], parts)]
+    elif search_text:
+        candidates = search_index.candidates(search_text) if _index_matches(search_index, df) else None
+        if candidates is not None:
+            df_filtered = df_filtered.iloc[candidates]
+        df_filtered = df_filtered[contains_text(df_filtered['Message'], search_text)]
+
+    # Direction filter
+    direction = filters["direction"]
+    if direction != "All":
+        df_filtered = df_filtered[df_filtered['Direction'] == direction]
+
+    # Date range filter
+    start_dt, end_dt, date_error = parse_date_filters(filters)
+    if start_dt is not None:
+        df_filtered = df_filtered[df_filtered['timestamp'] >= start_dt]
+    if end_dt is not None:
+        df_filtered = df_filtered[df_filtered['timestamp'] <= end_dt]
+
+    # Contact filter
+    if filters["contacts"]:
+        df_filtered = df_filtered[df_filtered['Contact'].isin(filters["contacts"])]
+
+    return df_filtered, date_error
+
+def count_keyword(filtered_df, keyword, search_index=None, df=None, match="Substring"):
+    # search_index and df are the full-text index and the frame it was built
+    # from; only the rows it finds the keyword in are counted then, and a
+    # single "Words" token or prefix is counted from its postings alone
+    if not keyword:
+        return 0
+    indexed = df is not None and _index_matches(search_index, df)
+    rows = filtered_df
+    if match == "Words":
+        tokens, prefix = _keyword_part(keyword)
+        if not tokens:
+            return 0
+        if indexed:
+            positions = filtered_df.index.to_numpy()
+            keyword_count = search_index.keyword_count(tokens, prefix, positions)
+            if keyword_count is not None:
+                return keyword_count
+            rows = filtered_df[np.isin(positions, search_index.search([(tokens, prefix)]))]
+        return rows['Message'].dropna().str.lower().str.count(word_pattern(tokens, prefix)).sum()
+
+    if indexed:
+        candidates = search_index.candidates(keyword)
+        if candidates is not None:
+            rows = filtered_df[np.isin(filtered_df.index.to_numpy(), candidates)]
+    return rows['Message'].dropna().str.lower().str.count(re.escape(keyword)).sum()
+
+@traced("stats", rows=lambda stats: 0 if stats is None else stats["total"])
+def compute_stats(filtered_df, keyword, search_index=None, df=None, match="Substring"):
+    if filtered_df is None or filtered_df.empty:
+        return None
+
+    return {
+        "total": len(filtered_df),
+        "sent": (filtered_df['Direction'] == 'Sent').sum(),
+        "received": (filtered_df['Direction'] == 'Received').sum(),
+        "keyword_count": count_keyword(filtered_df, keyword, search_index, df, match),
+        "counts_per_day": filtered_df.groupby(pd.to_datetime(filtered_df['timestamp']).dt.date).size()
+    }
+
+def message_index(df):
+    # Hash index from message key (see message_key) to row position in df,
+    # built once per filtered frame so position lookups are O(1)
+    if 'source_db' in df:
+        index = pd.MultiIndex.from_arrays([df['source_db'].astype(object), df['message_id']])
+    else:
+        index = pd.Index(df['message_id'])
+    _ = index.is_unique  # build the hash table on the worker
+    return index
+
+def message_key(row):
+    # Source row id, qualified by the source DB in merged batch frames
+    if 'source_db' in row:
+        return (row['source_db'], row['message_id'])
+    return row['message_id']
+
+def find_message(index, key):
+    # Row position of the message in the frame index was built from, or None
+    if index is None or key is None or not index.is_unique:
+        return None
+    try:
+        return int(index.get_loc(key))
+    except (KeyError, TypeError):
+        return None
+
+def has_media(df):
+    # Rows with a non-empty, non-None media_path
+    media_path = df['media_path']
+    text = media_path.astype(str)
+    return media_path.notnull() & (text.str.strip() != '') & (text.str.lower() != 'none')
+
+@traced("media_df", rows=len)
+def build_media_df(filtered_df, selected_contacts):
+    # Only keep rows with a non-empty, non-None media_path
+    if filtered_df is None:
+        return pd.DataFrame()
+    media_df = filtered_df[has_media(filtered_df)]
+
+    # Prioritize selected contacts at the top
+    if selected_contacts:
+        priority = (~media_df['Contact'].isin(selected_contacts)).astype(int)
+        return media_df.assign(priority=priority).sort_values(['priority', 'Contact', 'timestamp']).drop(columns=['priority'])
+    return media_df.sort_values(['Contact', 'timestamp'])
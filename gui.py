@@ -1,12 +1,27 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from parser import parse_db
-from utils import find_sqlite_files
-from PIL import Image, ImageTk
+from parser import iter_parse_db, parse_db_incremental, high_water_mark, concat_chunks, sort_chronologically
+from utils import scan_sqlite_files, format_db_summary, format_size
+from cache import ParseCache
+from batch import parse_many
+from filters import MATCH_MODES, filter_messages, compute_stats, count_keyword, build_media_df, message_index, message_key, find_message
+from aggregates import build_cube, cube_can_answer, cube_stats, cube_media_counts
+from worker import BackgroundWorker
+from search_index import open_index
+from query import list_contacts, query_messages
+from working_copy import prepare_working_copy
+from connections import source_stat
+from virtual_tree import VirtualTreeview
+from adapters import AUTO_DETECT, app_names
+from media_gallery import MediaGallery
+from thumbnails import ThumbnailCache
+from conversations import list_conversations, fetch_conversation_page
+from diagnostics import TRACER, span, traced
+from diagnostics_panel import DiagnosticsPanel
+from media_audit import MediaAudit, add_audit_columns
 import os
 import pandas as pd
 import collections
-import re
 
 class ParsePalApp:
     def __init__(self, root):
@@ -14,28 +29,60 @@ class ParsePalApp:
         self.root.title("ParsePal – DB Parser")
 
         self.folder_path = tk.StringVar()
-        self.selected_app = tk.StringVar(value="WhatsApp")
+        self.scan_exclude_var = tk.StringVar()
+        self.scan_depth_var = tk.StringVar()
+        self.db_paths = []
+        self.selected_app = tk.StringVar(value=AUTO_DETECT)
         self.search_var = tk.StringVar()
         self.keyword_var = tk.StringVar()
+        self.match_var = tk.StringVar(value=MATCH_MODES[0])
         self.direction_var = tk.StringVar(value="All")
         self.start_date_var = tk.StringVar()
         self.end_date_var = tk.StringVar()
         self.df = None
         self.filtered_df = None
+        self.media_df = None
+        self.media_counts = None
+        self.media_unique_counts = None
+        self.message_index = None
+        self.conversations_df = None
+        self.conversations_key = None
+        self.conversation = None
+        self.keyword = ""
+        self.parse_source = None
+        self.high_water = None
+        self.partial = False
+        self.batch_report = None
+        self.search_index = None
+        self.cube = None
+        self.query_source = None
+        self.query_db_var = tk.BooleanVar(value=False)
+        self.parse_cache = ParseCache()
+        self.media_audit = MediaAudit()
+        self.status_var = tk.StringVar()
+        self.media_view_var = tk.StringVar(value="List")
         self.preview_windows = {}
         self.last_previewed_media = None
         
         self.setup_ui()
-        self.tree.bind("<<TreeviewSelect>>", self.on_message_select)
 
-    def on_message_select(self, event):
-        selected = self.tree.selection()
-        if not selected or self.filtered_df is None:
+        # Parsing and filtering run off the Tk thread, search indexing on its own thread
+        self.worker = BackgroundWorker(self.root, on_busy_change=self.on_busy_change)
+        # Filters the first rows of a parse while self.worker reads the rest
+        self.preview_worker = BackgroundWorker(self.root, on_busy_change=self.on_busy_change)
+        self.index_worker = BackgroundWorker(self.root, on_busy_change=self.on_busy_change)
+        self.scan_worker = BackgroundWorker(self.root, on_busy_change=self.on_busy_change)
+        self.conversation_worker = BackgroundWorker(self.root, on_busy_change=self.on_busy_change)
+        self.audit_worker = BackgroundWorker(self.root, on_busy_change=self.on_busy_change)
+        self.thumbnails = ThumbnailCache(self.root)
+
+    def on_message_select(self, index):
+        if self.filtered_df is None:
             return
 
-        index = self.tree.index(selected[0])
         row = self.filtered_df.iloc[index]
         media_path = row.get("media_path")
+        self.prefetch_media(self.filtered_df, index)
 
         # Only open if media_path is valid and different from last previewed
         if media_path and os.path.isfile(media_path):
@@ -64,19 +111,29 @@ class ParsePalApp:
 
         preview_win.protocol("WM_DELETE_WINDOW", on_close)
 
-        try:
-            img = Image.open(filepath)
-            img.thumbnail((400, 400))
-            img_tk = ImageTk.PhotoImage(img)
-            label = tk.Label(preview_win, image=img_tk)
-            label.image = img_tk  # keep reference
-            label.pack()
-        except Exception as e:
-            tk.Label(preview_win, text=f"Failed to load media:\n{e}").pack()
+        label = tk.Label(preview_win, text="Loading preview...", width=50, height=20)
+        label.pack()
+
+        def on_thumbnail(photo, error):
+            if not label.winfo_exists():
+                return
+            if error is not None:
+                label.config(text=f"Failed to load media:\n{error}", width=0, height=0)
+                return
+            label.config(image=photo, text="", width=0, height=0)
+            label.image = photo  # keep reference
+
+        self.thumbnails.get(filepath, on_thumbnail)
+
+    def prefetch_media(self, rows, index, radius=10):
+        # Decode the media around the selected row ahead of time
+        nearby = rows['media_path'].iloc[max(index - radius, 0):index + radius + 1]
+        self.thumbnails.prefetch([path for path in nearby.dropna().tolist() if isinstance(path, str) and path.strip()])
 
     def setup_ui(self):
         notebook = ttk.Notebook(self.root)
         notebook.pack(fill='both', expand=True)
+        self.notebook = notebook
 
         # --- Messages Tab ---
         self.tab_messages = ttk.Frame(notebook)
@@ -90,19 +147,35 @@ class ParsePalApp:
         ttk.Entry(frame, textvariable=self.folder_path, width=50).grid(row=0, column=1, sticky="we")
         ttk.Button(frame, text="Browse", command=self.browse_folder).grid(row=0, column=2, padx=5)
 
-        # Scan for DB files
-        ttk.Button(frame, text="Scan for .db Files", command=self.find_databases).grid(row=1, column=1, pady=10)
+        # Scan for DB files, recognized by their SQLite header
+        scan_frame = ttk.Frame(frame)
+        scan_frame.grid(row=1, column=1, pady=10)
+        ttk.Button(scan_frame, text="Scan for Databases", command=self.find_databases).pack(side="left", padx=5)
+        ttk.Label(scan_frame, text="Exclude:").pack(side="left")
+        ttk.Entry(scan_frame, textvariable=self.scan_exclude_var, width=25).pack(side="left", padx=5)
+        ttk.Label(scan_frame, text="Max depth:").pack(side="left")
+        ttk.Entry(scan_frame, textvariable=self.scan_depth_var, width=4).pack(side="left", padx=5)
 
         # Listbox for DB files
-        self.db_listbox = tk.Listbox(frame, width=80, height=5, selectmode=tk.SINGLE)
+        self.db_listbox = tk.Listbox(frame, width=80, height=5, selectmode=tk.EXTENDED)
         self.db_listbox.grid(row=2, column=0, columnspan=3, pady=10, sticky="we")
 
         # App preset selector
         ttk.Label(frame, text="Select App Preset:").grid(row=3, column=0, sticky="e")
-        ttk.OptionMenu(frame, self.selected_app, "WhatsApp", "WhatsApp", "Messenger", "Telegram").grid(row=3, column=1, sticky="w")
+        ttk.OptionMenu(frame, self.selected_app, AUTO_DETECT, AUTO_DETECT, *app_names()).grid(row=3, column=1, sticky="w")
 
         # Parse button
-        ttk.Button(frame, text="Parse Selected DB", command=self.parse_selected).grid(row=4, column=1, pady=10)
+        parse_frame = ttk.Frame(frame)
+        parse_frame.grid(row=4, column=1, pady=10)
+        ttk.Button(parse_frame, text="Parse Selected DB", command=self.parse_selected).pack(side="left", padx=5)
+        ttk.Button(parse_frame, text="Refresh", command=self.refresh_current).pack(side="left", padx=5)
+        ttk.Button(parse_frame, text="Parse All (Batch)", command=self.parse_batch).pack(side="left", padx=5)
+        ttk.Checkbutton(parse_frame, text="Query DB directly", variable=self.query_db_var).pack(side="left", padx=5)
+        status_frame = ttk.Frame(frame)
+        status_frame.grid(row=4, column=2, sticky="w")
+        self.progress = ttk.Progressbar(status_frame, mode="indeterminate", length=80)
+        self.progress.pack(side="left", padx=5)
+        ttk.Label(status_frame, textvariable=self.status_var).pack(side="left")
 
         # Filters frame
         filters_frame = ttk.LabelFrame(frame, text="Filters")
@@ -116,6 +189,10 @@ class ParsePalApp:
         ttk.Label(filters_frame, text="Keyword (for stats):").grid(row=0, column=2, sticky="e")
         ttk.Entry(filters_frame, textvariable=self.keyword_var, width=20).grid(row=0, column=3, padx=5, sticky="w")
 
+        # Substring or token/prefix*/"phrase" matching, for search and keyword
+        ttk.Label(filters_frame, text="Match:").grid(row=0, column=4, sticky="e")
+        ttk.OptionMenu(filters_frame, self.match_var, MATCH_MODES[0], *MATCH_MODES).grid(row=0, column=5, sticky="w")
+
         # Direction filter
         ttk.Label(filters_frame, text="Direction:").grid(row=1, column=0, sticky="e")
         ttk.OptionMenu(filters_frame, self.direction_var, "All", "All", "Sent", "Received").grid(row=1, column=1, sticky="w")
@@ -134,23 +211,15 @@ class ParsePalApp:
 
         # Filter buttons
         btn_frame = ttk.Frame(filters_frame)
-        btn_frame.grid(row=3, column=0, columnspan=4, pady=10)
+        btn_frame.grid(row=3, column=0, columnspan=6, pady=10)
 
         ttk.Button(btn_frame, text="Apply Filters", command=self.apply_filters).pack(side="left", padx=5)
         ttk.Button(btn_frame, text="Clear Filters", command=self.clear_filters).pack(side="left", padx=5)
 
-        # Treeview for messages
+        # Treeview for messages, only the visible rows are materialized
         columns = ("Contact", "Message", "Timestamp", "Direction", "Media")
-        self.tree = ttk.Treeview(frame, columns=columns, show='headings', height=15)
-        for col in columns:
-            self.tree.heading(col, text=col)
-            self.tree.column(col, width=150)
-        self.tree.grid(row=6, column=0, columnspan=3, pady=10, sticky="nsew")
-
-        # Scrollbar for Treeview
-        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
-        scrollbar.grid(row=6, column=3, sticky='ns')
+        self.tree = VirtualTreeview(frame, columns, self.message_row_values, height=15, on_select=self.on_message_select)
+        self.tree.grid(row=6, column=0, columnspan=4, pady=10, sticky="nsew")
 
         # Configure grid weights
         frame.columnconfigure(1, weight=1)
@@ -164,145 +233,568 @@ class ParsePalApp:
         self.tab_media = ttk.Frame(notebook)
         notebook.add(self.tab_media, text="Media")
 
+        # List or thumbnail grid view of the media
+        view_frame = ttk.Frame(self.tab_media)
+        view_frame.pack(anchor="nw", padx=10, pady=(10, 0))
+        for view in ("List", "Gallery"):
+            ttk.Radiobutton(view_frame, text=view, value=view, variable=self.media_view_var,
+                            command=self.switch_media_view).pack(side="left", padx=5)
+
+        self.media_views = ttk.Frame(self.tab_media)
+        self.media_views.pack(fill="both", expand=True, padx=10, pady=10)
+
         # Media Treeview
-        media_columns = ("Contact", "Timestamp", "Media Path", "Media Type", "Media Mime")
-        self.media_tree = ttk.Treeview(self.tab_media, columns=media_columns, show='headings', height=15)
-        for col in media_columns:
-            self.media_tree.heading(col, text=col)
-            self.media_tree.column(col, width=180)
-        self.media_tree.pack(fill="both", expand=True, padx=10, pady=10)
+        media_columns = ("Contact", "Timestamp", "Media Path", "Media Type", "Media Mime", "Size", "Status")
+        self.media_tree = VirtualTreeview(self.media_views, media_columns, self.media_row_values, height=15, column_width=180)
+        self.media_tree.pack(fill="both", expand=True)
+
+        # Gallery tiles get their own cache so they don't evict the previews
+        self.media_gallery = MediaGallery(self.media_views, ThumbnailCache(self.root, max_items=512),
+                                          on_open=self.open_media_preview)
 
         # Media preview on double-click
-        self.media_tree.bind("<Double-1>", self.on_media_select)
+        self.media_tree.bind_tree("<Double-1>", self.on_media_select)
         ttk.Button(self.tab_media, text="Show in Conversation", command=self.show_media_in_conversation).pack(anchor="ne", padx=10, pady=(0, 5))
 
+        # --- Conversations Tab ---
+        # Chat list on the left, the opened chat's messages on the right,
+        # read from the DB a page at a time as they are scrolled into view
+        self.tab_conversations = ttk.Frame(notebook, padding=10)
+        notebook.add(self.tab_conversations, text="Conversations")
+        self.conversations_status = tk.StringVar()
+        ttk.Label(self.tab_conversations, textvariable=self.conversations_status).pack(anchor="nw", pady=(0, 5))
+        panes = ttk.PanedWindow(self.tab_conversations, orient="horizontal")
+        panes.pack(fill="both", expand=True)
+        self.chat_tree = VirtualTreeview(panes, ("Chat", "Messages", "Media", "Last message"), self.chat_row_values,
+                                         height=20, column_width=110, on_select=self.open_conversation)
+        panes.add(self.chat_tree, weight=1)
+        self.conversation_tree = VirtualTreeview(panes, ("Timestamp", "Direction", "Message", "Media"),
+                                                 self.conversation_row_values, height=20, column_width=160,
+                                                 on_near_end=self.load_conversation_page)
+        panes.add(self.conversation_tree, weight=2)
+
+        # --- Diagnostics Tab ---
+        # Per-stage timings, row counts and memory, exportable as a JSON trace
+        self.tab_diagnostics = DiagnosticsPanel(notebook, TRACER)
+        notebook.add(self.tab_diagnostics, text="Diagnostics", padding=10)
+        notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+
+    def on_tab_changed(self, event):
+        selected = event.widget.select()
+        if selected == str(self.tab_diagnostics):
+            self.tab_diagnostics.refresh()
+        elif selected == str(self.tab_conversations):
+            self.load_conversations()
+
+    def load_conversations(self):
+        # The chat list follows the loaded DB and the current filters
+        if self.parse_source is None:
+            self.conversations_status.set("Parse a single database to browse its conversations.")
+            return
+        filters = self.current_filters()
+        key = (self.parse_source, self.high_water, repr(sorted(filters.items())))
+        if key == self.conversations_key:
+            return
+        self.conversations_key = key
+        self.conversations_status.set("Loading conversations...")
+        self.conversation_worker.submit("conversations", self.conversations_job, *self.parse_source, filters,
+                                        on_done=self.on_conversations_done, on_error=self.on_conversations_error)
+
+    def working_copy(self, db_path, app_name):
+        # Indexed working copy of db_path. Jobs ask for it every time, as the
+        # parse cache may have evicted it since the last one.
+        return prepare_working_copy(db_path, os.path.join(self.parse_cache.cache_dir, "work"), app_name)
+
+    def conversations_job(self, job, db_path, app_name, filters):
+        # Runs on the conversation worker thread, against the indexed working copy
+        work_path = self.working_copy(db_path, app_name)
+        job.check()
+        conversations = list_conversations(work_path, app_name, filters, summary_path=work_path + ".conversations.pkl")
+        return (db_path, app_name, filters), conversations
+
+    def on_conversations_done(self, result):
+        source, self.conversations_df = result
+        self.conversation = {"source": source, "contact": None, "df": None, "after": None, "loading": False, "done": True}
+        self.conversations_status.set(f"{len(self.conversations_df)} conversations")
+        self.conversation_tree.set_frame(None)
+        self.chat_tree.set_frame(self.conversations_df)
+
+    def on_conversations_error(self, error):
+        # Reload on the next visit instead of retrying right away
+        self.conversations_key = None
+        if self.conversation is not None:
+            self.conversation.update(loading=False, done=True)
+        self.conversations_status.set("")
+        messagebox.showerror("Error", f"Error loading conversations: {error}")
+
+    def open_conversation(self, index):
+        # Only the opened chat's pages are kept in memory
+        contact = self.conversations_df.iloc[index]["Contact"]
+        self.conversation.update(contact=contact, df=None, after=None, loading=False, done=False)
+        self.conversation_tree.set_frame(None)
+        self.load_conversation_page()
+
+    def load_conversation_page(self):
+        conversation = self.conversation
+        if conversation is None or conversation["loading"] or conversation["done"]:
+            return
+        conversation["loading"] = True
+        db_path, app_name, filters = conversation["source"]
+        self.conversation_worker.submit("conversation_page", self.conversation_page_job, db_path, app_name,
+                                        conversation["contact"], conversation["after"], filters,
+                                        on_done=self.on_conversation_page, on_error=self.on_conversations_error)
+
+    def conversation_page_job(self, job, db_path, app_name, contact, after, filters):
+        # Runs on the conversation worker thread
+        work_path = self.working_copy(db_path, app_name)
+        page, next_after = fetch_conversation_page(work_path, app_name, contact, after, filters=filters)
+        return contact, after, page, next_after
+
+    def on_conversation_page(self, result):
+        contact, after, page, next_after = result
+        conversation = self.conversation
+        if contact != conversation["contact"] or after != conversation["after"]:
+            return
+        conversation.update(after=next_after, loading=False, done=next_after is None)
+        if conversation["df"] is None:
+            conversation["df"] = page
+            self.conversation_tree.set_frame(page)
+        else:
+            conversation["df"] = pd.concat([conversation["df"], page], ignore_index=True)
+            self.conversation_tree.extend_frame(conversation["df"])
+
+    def chat_row_values(self, rows):
+        return list(rows[['Contact', 'messages', 'media', 'last_message']].itertuples(index=False, name=None))
+
+    def conversation_row_values(self, rows):
+        values = []
+        for row in rows.itertuples(index=False):
+            media_path = row.media_path
+            has_media = bool(media_path) and str(media_path).strip().lower() not in ('', 'none')
+            values.append((row.timestamp, row.Direction, row.Message, "🖼️" if has_media else ""))
+        return values
+
+    def switch_media_view(self):
+        # Carry the selection over so "Show in Conversation" keeps working
+        position = self.selected_media_position()
+        if self.media_view_var.get() == "Gallery":
+            self.media_tree.pack_forget()
+            self.media_gallery.pack(fill="both", expand=True)
+            if position is not None:
+                self.media_gallery.see(position)
+        else:
+            self.media_gallery.pack_forget()
+            self.media_tree.pack(fill="both", expand=True)
+            if position is not None:
+                self.media_tree.see(position)
+
+    def selected_media_position(self):
+        if self.media_view_var.get() == "Gallery":
+            return self.media_gallery.selection()
+        return self.media_tree.selection()
+
     def browse_folder(self):
         folder = filedialog.askdirectory()
         if folder:
             self.folder_path.set(folder)
 
     def find_databases(self):
-        self.db_listbox.delete(0, tk.END)
         folder = self.folder_path.get()
-        dbs = find_sqlite_files(folder)
-        for db in dbs:
-            self.db_listbox.insert(tk.END, db)
+        exclude = [pattern.strip() for pattern in self.scan_exclude_var.get().split(",") if pattern.strip()]
+        max_depth = self.scan_depth_var.get().strip()
+        if max_depth and not max_depth.isdigit():
+            messagebox.showerror("Error", "Max depth must be a whole number.")
+            return
+
+        self.db_listbox.delete(0, tk.END)
+        self.db_paths = []
+        self.status_var.set("Scanning...")
+        self.scan_worker.submit("scan", self.scan_job, folder, exclude, int(max_depth) if max_depth else None,
+                                on_done=self.on_scan_done, on_error=self.on_scan_error)
+
+    def scan_job(self, job, folder, exclude, max_depth):
+        # Databases are listed as they are found instead of after the whole walk
+        return scan_sqlite_files(folder, on_found=lambda info: job.post(self.add_scanned_db, info),
+                                 exclude=exclude, max_depth=max_depth, should_stop=lambda: job.cancelled)
+
+    def add_scanned_db(self, info):
+        self.db_paths.append(info["path"])
+        self.db_listbox.insert(tk.END, format_db_summary(info))
+        self.status_var.set(f"Scanning... {len(self.db_paths)} databases found")
+
+    def on_scan_done(self, results):
+        # Relist in path order once the walk is complete
+        self.db_listbox.delete(0, tk.END)
+        self.db_paths = [info["path"] for info in results]
+        for info in results:
+            self.db_listbox.insert(tk.END, format_db_summary(info))
+        self.status_var.set(f"Found {len(results)} databases")
+
+    def on_scan_error(self, error):
+        self.status_var.set("")
+        messagebox.showerror("Error", f"Error scanning folder: {error}")
 
     def parse_selected(self):
         try:
-            selected = self.db_listbox.get(self.db_listbox.curselection())
-            self.df = parse_db(selected, self.selected_app.get())
+            selected = self.db_paths[self.db_listbox.curselection()[0]]
+        except Exception as e:
+            messagebox.showerror("Error", f"Error parsing DB: {e}")
+            return
+        self.load_database(selected, self.selected_app.get())
+
+    def refresh_current(self):
+        # Pull in messages added to the loaded DB since it was parsed
+        if self.parse_source is not None:
+            self.load_database(*self.parse_source)
+
+    def load_database(self, db_path, app_name):
+        # For huge extracts, keep only the rows matching the filters in memory
+        if self.query_db_var.get():
+            self.status_var.set("Preparing working copy...")
+            self.worker.submit("parse", self.query_setup_job, db_path, app_name,
+                               on_done=self.on_query_setup_done, on_error=self.on_parse_error)
+            return
 
-            # Fill contacts listbox for filtering
-            self.contact_listbox.delete(0, tk.END)
-            contacts = sorted(self.df['Contact'].dropna().unique())
-            for c in contacts:
-                self.contact_listbox.insert(tk.END, c)
+        # Refreshing the loaded DB can build on the frame already in memory
+        previous = None
+        if self.parse_source == (db_path, app_name) and self.high_water is not None:
+            previous = (self.df, self.high_water)
+
+        self.status_var.set("Parsing...")
+        self.worker.submit("parse", self.parse_job, db_path, app_name, previous,
+                           on_done=self.on_parse_done, on_error=self.on_parse_error)
+
+    def parse_job(self, job, db_path, app_name, previous):
+        # Runs on the worker thread
+        db_stat = source_stat(db_path)
+        result = {"source": (db_path, app_name), "high_water": None, "message": None, "cached": False, "full_parse": False}
+
+        # Unchanged DBs are loaded straight from the parse cache
+        cached = self.parse_cache.load(db_path, app_name)
+        if cached is not None:
+            # The high-water mark comes back with the frame, so the next
+            # refresh can be incremental
+            cached, high_water = cached
+            # The count cube is stored with the frame; older entries lack it
+            cube = self.parse_cache.load_cube(db_path, app_name)
+            if cube is None:
+                cube = build_cube(cached)
+            result.update(df=cached, cube=cube, high_water=high_water, cached=True,
+                          message=f"Loaded {len(cached)} messages from cache")
+            return result
+
+        # Changed DBs parsed before only need the rows past the old high-water mark
+        if previous is None:
+            previous = self.parse_cache.load_for_refresh(db_path, app_name)
+        if previous is not None and previous[1] is not None:
+            df, high_water, full = parse_db_incremental(db_path, app_name, *previous)
+            # A replaced DB is parsed from scratch, and new rows sorted in
+            # among the old ones move them; either way the index starts over
+            message = f"Parsed {len(df)} messages" if full else f"Added {len(df) - len(previous[0])} new messages"
+            result.update(df=df, high_water=high_water, full_parse=full, message=message)
+        else:
+            high_water = high_water_mark(db_path, app_name)
+            # Read in id order so the first rows show at once, sorted when complete
+            chunks = iter_parse_db(db_path, app_name, until=high_water, chronological=False,
+                                   progress_callback=lambda done, total: job.post(self.update_parse_progress, done, total))
+            parts = []
+            try:
+                for chunk in chunks:
+                    job.check()
+                    parts.append(chunk)
+                    # Show the first rows while the rest is still being read
+                    if len(parts) == 1:
+                        job.post(self.show_partial_data, chunk)
+            finally:
+                chunks.close()
+            result.update(df=sort_chronologically(concat_chunks(parts)), high_water=high_water, full_parse=True)
+
+        job.check()
+        result["cube"] = build_cube(result["df"])
+        try:
+            self.parse_cache.store(db_path, app_name, result["df"], result["high_water"], db_stat, result["cube"])
+        except Exception as e:
+            result["message"] = f"Could not write parse cache: {e}"
+        return result
+
+    def query_setup_job(self, job, db_path, app_name):
+        # Runs on the worker thread
+        work_path = self.working_copy(db_path, app_name)
+        return (db_path, app_name), list_contacts(work_path, app_name)
+
+    def on_query_setup_done(self, result):
+        self.parse_source, contacts = result
+        self.query_source = self.parse_source
+        self.partial = False
+        self.df = None
+        self.cube = None
+        self.high_water = None
+        self.search_index = None
+        self.status_var.set("Querying the DB for each filter change")
+        self.fill_contacts(contacts)
+        self.apply_filters()
 
-            self.apply_filters()
-            self.update_media_tab()
+    def show_partial_data(self, df):
+        self.partial = True
+        self.df = df
+        self.cube = None
+        self.query_source = None
+        self.parse_source = None
+        self.high_water = None
+        self.search_index = None
+        self.load_parsed_data()
+
+    def on_parse_done(self, result):
+        self.partial = False
+        self.df = result["df"]
+        self.cube = result["cube"]
+        self.query_source = None
+        self.parse_source = result["source"]
+        self.high_water = result["high_water"]
+        self.status_var.set(result["message"] or f"Loaded {len(self.df)} messages")
+        self.load_parsed_data()
+        self.build_search_index(result["full_parse"])
+        if not result["cached"]:
             messagebox.showinfo("Success", "Parsed and loaded data from the selected database.")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error parsing DB: {e}")
 
-    def apply_filters(self):
-        if self.df is None:
-            return
+    def on_parse_error(self, error):
+        self.partial = False
+        self.status_var.set("")
+        messagebox.showerror("Error", f"Error parsing DB: {error}")
 
-        df_filtered = self.df.copy()
+    def on_busy_change(self, busy):
+        # Shared by all workers, so check them together
+        if any(worker.busy for worker in (self.worker, self.preview_worker, self.index_worker, self.scan_worker,
+                                           self.conversation_worker, self.audit_worker)):
+            self.progress.start(50)
+        else:
+            self.progress.stop()
+
+    def build_search_index(self, rebuild=False):
+        # The index is kept next to the parse cache entry, so a cached or
+        # refreshed DB only indexes the rows it hasn't seen yet
+        self.search_index = None
+        index_path = None
+        if self.parse_source is not None:
+            index_path = self.parse_cache.index_path(*self.parse_source)
+        self.index_worker.submit("index", self.index_job, self.df, index_path, rebuild, on_done=self.on_index_done)
+
+    def index_job(self, job, df, index_path, rebuild):
+        # Runs on the index worker thread
+        index = open_index(index_path)
+        if rebuild:
+            index.reset()
+        index.update(df, should_stop=lambda: job.cancelled)
+        job.check()
+        return df, index
+
+    def on_index_done(self, result):
+        df, index = result
+        if df is not self.df:
+            return
+        # Later filters search through the index; it finds the same rows as
+        # the scan, so the current results stand
+        self.search_index = index
+
+    def parse_batch(self):
+        # Parse the selected DBs (or every scanned DB) in a process pool
+        indices = self.db_listbox.curselection()
+        if len(indices) < 2:
+            indices = range(len(self.db_paths))
+        db_paths = [self.db_paths[i] for i in indices]
+        if not db_paths:
+            return
 
-        # Search message text
-        search_text = self.search_var.get().lower()
-        if search_text:
-            df_filtered = df_filtered[df_filtered['Message'].str.lower().str.contains(search_text, na=False)]
+        self.status_var.set(f"Parsed 0 / {len(db_paths)} databases")
+        self.worker.submit("parse", self.batch_job, db_paths, self.selected_app.get(),
+                           on_done=self.on_batch_done, on_error=self.on_parse_error)
+
+    def batch_job(self, job, db_paths, app_name):
+        def progress(done, total):
+            job.post(self.status_var.set, f"Parsed {done} / {total} databases")
+        df, report = parse_many(db_paths, app_name, progress_callback=progress)
+        return df, report, build_cube(df)
+
+    def on_batch_done(self, result):
+        self.df, self.batch_report, self.cube = result
+        self.query_source = None
+        # A merged batch has no single source to refresh from
+        self.parse_source = None
+        self.high_water = None
+        self.load_parsed_data()
+        self.build_search_index()
+        self.show_batch_report()
+
+    def show_batch_report(self):
+        report_win = tk.Toplevel(self.root)
+        report_win.title("Batch Parse Report")
+        text_box = tk.Text(report_win, height=20, width=100)
+        text_box.pack(fill="both", expand=True, padx=10, pady=10)
+        for _, row in self.batch_report.iterrows():
+            status = f"ERROR: {row['error']}" if pd.notna(row['error']) else f"{row['rows']} messages"
+            text_box.insert(tk.END, f"{row['source_db']}  {row['seconds']:.2f}s  {status}\n")
+        text_box.config(state=tk.DISABLED)
 
-        # Keyword frequency count (store keyword)
-        self.keyword = self.keyword_var.get().lower()
+    def update_parse_progress(self, rows_done, total_rows):
+        self.status_var.set(f"Loaded {rows_done} / {total_rows} messages")
 
-        # Direction filter
-        direction = self.direction_var.get()
-        if direction != "All":
-            df_filtered = df_filtered[df_filtered['Direction'] == direction]
+    def load_parsed_data(self):
+        self.fill_contacts(sorted(self.df['Contact'].dropna().unique()))
+        self.apply_filters()
 
-        # Date range filter
-        start_date = self.start_date_var.get().strip()
-        end_date = self.end_date_var.get().strip()
-        try:
-            if start_date:
-                start_dt = pd.to_datetime(start_date)
-                df_filtered = df_filtered[df_filtered['timestamp'] >= start_dt]
-            if end_date:
-                end_dt = pd.to_datetime(end_date)
-                df_filtered = df_filtered[df_filtered['timestamp'] <= end_dt]
-        except Exception:
-            messagebox.showwarning("Date format error", "Please enter dates in YYYY-MM-DD format.")
+    def fill_contacts(self, contacts):
+        # Fill contacts listbox for filtering
+        self.contact_listbox.delete(0, tk.END)
+        for c in contacts:
+            self.contact_listbox.insert(tk.END, c)
 
-        # Contact filter
+    def current_filters(self):
+        # Snapshot of the filter widgets, taken on the Tk thread
         selected_indices = self.contact_listbox.curselection()
-        if selected_indices:
-            selected_contacts = [self.contact_listbox.get(i) for i in selected_indices]
-            df_filtered = df_filtered[df_filtered['Contact'].isin(selected_contacts)]
+        return {
+            "search": self.search_var.get(),
+            "keyword": self.keyword_var.get().lower(),
+            "match": self.match_var.get(),
+            "direction": self.direction_var.get(),
+            "start_date": self.start_date_var.get().strip(),
+            "end_date": self.end_date_var.get().strip(),
+            "contacts": [self.contact_listbox.get(i) for i in selected_indices]
+        }
 
-        self.filtered_df = df_filtered
+    def apply_filters(self):
+        # A newer filter job supersedes one that is still running. While a
+        # parse is still running on self.worker, the rows read so far are
+        # filtered on the preview worker instead of waiting behind it.
+        worker, other = (self.preview_worker, self.worker) if self.partial else (self.worker, self.preview_worker)
+        other.cancel("filter")
+        if self.query_source is not None:
+            worker.submit("filter", self.query_filter_job, self.query_source, self.current_filters(),
+                          on_done=self.on_filters_done)
+        elif self.df is not None:
+            worker.submit("filter", self.filter_job, self.df, self.current_filters(), self.search_index, self.cube,
+                          on_done=self.on_filters_done)
+
+    def filter_job(self, job, df, filters, search_index, cube):
+        # Runs on the worker thread
+        filtered_df, date_error = filter_messages(df, filters, search_index)
+        job.check()
+        return self.summarize_filtered(job, filtered_df, date_error, filters, search_index, df, cube)
+
+    def query_filter_job(self, job, query_source, filters):
+        # Runs on the worker thread, the filters are applied in SQL on the
+        # working copy of the (db_path, app_name) query_source
+        db_path, app_name = query_source
+        filtered_df, date_error = query_messages(self.working_copy(db_path, app_name), app_name, filters)
+        job.check()
+        return self.summarize_filtered(job, filtered_df, date_error, filters)
+
+    def summarize_filtered(self, job, filtered_df, date_error, filters, search_index=None, df=None, cube=None):
+        # Stats and media counts come from the pre-aggregated cube when the
+        # filters allow it, otherwise from the filtered messages
+        media_df = build_media_df(filtered_df, filters["contacts"])
+        job.check()
+        if cube is not None and cube_can_answer(filters):
+            stats = cube_stats(cube, filters)
+            if stats is not None:
+                stats["keyword_count"] = count_keyword(filtered_df, filters["keyword"], search_index, df, filters["match"])
+            media_counts = cube_media_counts(cube, filters)
+        else:
+            stats = compute_stats(filtered_df, filters["keyword"], search_index, df, filters["match"])
+            media_counts = None
+            if not media_df.empty:
+                # A categorical Contact also counts the contacts without media
+                media_counts = media_df['Contact'].value_counts()
+                media_counts = media_counts[media_counts > 0]
+        return {
+            "filtered_df": filtered_df,
+            "message_index": message_index(filtered_df),
+            "date_error": date_error,
+            "keyword": filters["keyword"],
+            "stats": stats,
+            "media_df": media_df,
+            "media_counts": media_counts
+        }
+
+    def on_filters_done(self, result):
+        if result["date_error"]:
+            messagebox.showwarning("Date format error", "Please enter dates in YYYY-MM-DD format.")
+
+        # The selected message stays selected if it passes the new filters
+        selected = self.selected_message_key()
+        self.filtered_df = result["filtered_df"]
+        self.message_index = result["message_index"]
+        self.keyword = result["keyword"]
+        self.media_df = result["media_df"]
 
         # Update message list
         self.update_message_table()
+        position = find_message(self.message_index, selected)
+        if position is not None:
+            self.tree.see(position, notify=False)
 
         # Update stats tab
-        self.update_stats_tab()
+        self.update_stats_tab(result["stats"])
 
         # Update media tab with filtered data
-        self.update_media_tab()
+        self.update_media_tab(result["media_counts"])
+
+        if self.notebook.select() == str(self.tab_conversations):
+            self.load_conversations()
 
     def clear_filters(self):
         self.search_var.set("")
         self.keyword_var.set("")
+        self.match_var.set(MATCH_MODES[0])
         self.direction_var.set("All")
         self.start_date_var.set("")
         self.end_date_var.set("")
         self.contact_listbox.selection_clear(0, tk.END)
         self.apply_filters()
 
-    def update_message_table(self):
-        for row in self.tree.get_children():
-            self.tree.delete(row)
+    def selected_message_key(self):
+        position = self.tree.selection()
+        if position is None or self.filtered_df is None or position >= len(self.filtered_df):
+            return None
+        return message_key(self.filtered_df.iloc[position])
 
-        for _, row in self.filtered_df.iterrows():
-            has_media = bool(row.get('media_path')) and str(row.get('media_path')).strip().lower() not in ('', 'none')
+    def update_message_table(self):
+        with span("treeview.messages", rows=len(self.filtered_df)):
+            self.tree.set_frame(self.filtered_df)
+
+    def message_row_values(self, rows):
+        values = []
+        for row in rows.itertuples(index=False):
+            media_path = row.media_path
+            has_media = bool(media_path) and str(media_path).strip().lower() not in ('', 'none')
             media_icon = "🖼️" if has_media else ""
-            self.tree.insert("", "end", values=(
-                row.get('Contact', ''),
-                row.get('Message', ''),
-                row.get('timestamp', ''),
-                row.get('Direction', ''),
-                media_icon
-            ))
-
-    def update_stats_tab(self):
+            values.append((row.Contact, row.Message, row.timestamp, row.Direction, media_icon))
+        return values
+
+    def media_row_values(self, rows):
+        values = []
+        for row in rows.itertuples(index=False):
+            # Size and status are blank until the media audit has run
+            size = getattr(row, "size", None)
+            status = "missing" if getattr(row, "missing", False) else "duplicate" if getattr(row, "duplicate", False) else ""
+            values.append((row.Contact, row.timestamp, row.media_path, row.media_type, row.media_mime,
+                           "" if pd.isna(size) else format_size(size), status))
+        return values
+
+    @traced("stats_tab")
+    def update_stats_tab(self, stats):
         # Clear previous widgets
         for widget in self.tab_stats.winfo_children():
             widget.destroy()
 
-        if self.filtered_df is None or self.filtered_df.empty:
+        if stats is None:
             ttk.Label(self.tab_stats, text="No data to show stats for.").pack(pady=10)
             return
 
-        # Total messages count
-        total_msgs = len(self.filtered_df)
-
-        # Sent vs Received counts
-        sent_count = (self.filtered_df['Direction'] == 'Sent').sum()
-        received_count = (self.filtered_df['Direction'] == 'Received').sum()
-
-        # Messages per day
-        daily_counts = self.filtered_df.copy()
-        daily_counts['date_only'] = pd.to_datetime(daily_counts['timestamp']).dt.date
-        counts_per_day = daily_counts.groupby('date_only').size()
-
-        # Keyword frequency count if keyword provided
-        keyword_count = 0
-        if self.keyword:
-            keyword_count = self.filtered_df['Message'].dropna().str.lower().str.count(re.escape(self.keyword)).sum()
+        total_msgs = stats["total"]
+        sent_count = stats["sent"]
+        received_count = stats["received"]
+        counts_per_day = stats["counts_per_day"]
+        keyword_count = stats["keyword_count"]
 
         # Display stats
         ttk.Label(self.tab_stats, text="Statistics Summary", font=('Helvetica', 16, 'bold')).pack(anchor='w', pady=10)
@@ -324,60 +816,63 @@ class ParsePalApp:
         text_box.config(state=tk.DISABLED)
 
     def on_media_select(self, event):
-        selected = self.media_tree.selection()
-        if not selected or self.df is None:
+        self.open_media_preview(self.media_tree.selection())
+
+    def open_media_preview(self, index):
+        if index is None or self.media_df is None:
             return
-        index = self.media_tree.index(selected[0])
         row = self.media_df.iloc[index]
         media_path = row.get("media_path")
-        if media_path and os.path.isfile(media_path):
+        self.prefetch_media(self.media_df, index)
+        # The audit already knows which files are missing
+        exists = not row["missing"] if "missing" in row.index else bool(media_path) and os.path.isfile(media_path)
+        if exists:
             self.show_media_preview(media_path)
 
     def show_media_in_conversation(self):
-        selected = self.media_tree.selection()
-        if not selected or self.media_df is None or self.filtered_df is None:
+        index = self.selected_media_position()
+        if index is None or self.media_df is None or self.filtered_df is None:
             return
-        index = self.media_tree.index(selected[0])
-        media_row = self.media_df.iloc[index]
-        # Find the index in filtered_df that matches this media (by timestamp and contact)
-        match = self.filtered_df[
-            (self.filtered_df['timestamp'] == media_row['timestamp']) &
-            (self.filtered_df['Contact'] == media_row['Contact'])
-        ]
-        if not match.empty:
-            msg_index = match.index[0]
-            # Find the corresponding item in the treeview and select it
-            for item in self.tree.get_children():
-                vals = self.tree.item(item, 'values')
-                if vals and vals[0] == media_row['Contact'] and vals[2] == str(media_row['timestamp']):
-                    self.tree.selection_set(item)
-                    self.tree.see(item)
-                    self.root.nametowidget(self.root.winfo_children()[0]).select(0)  # Switch to Messages tab
-                    break
-
-    def update_media_tab(self):
-        # Only show rows with actual media
-        if self.filtered_df is None:
-            self.media_df = pd.DataFrame()
+        # media_df rows are filtered_df rows, found again by message id
+        position = find_message(self.message_index, message_key(self.media_df.iloc[index]))
+        if position is not None:
+            self.tree.see(position)
+            self.notebook.select(self.tab_messages)
+
+    @traced("media_tab")
+    def update_media_tab(self, counts):
+        self.media_counts = counts
+        self.media_unique_counts = None
+        self.media_tree.set_frame(self.media_df)
+        self.media_gallery.set_frame(self.media_df)
+        self.update_media_summary()
+
+        # Stat and hash the files in the background, then fill in the columns
+        if self.media_df is not None and not self.media_df.empty:
+            self.audit_worker.submit("media_audit", self.media_audit_job, self.media_df, on_done=self.on_media_audit_done,
+                                     on_error=lambda error: self.status_var.set(f"Media audit failed: {error}"))
         else:
-            # Only keep rows with a non-empty, non-None media_path
-            self.media_df = self.filtered_df[
-                self.filtered_df['media_path'].notnull() &
-                (self.filtered_df['media_path'].astype(str).str.strip() != '') &
-                (self.filtered_df['media_path'].astype(str).str.lower() != 'none')
-            ].copy()
-
-        for row in self.media_tree.get_children():
-            self.media_tree.delete(row)
-
-        for _, row in self.media_df.iterrows():
-            self.media_tree.insert("", "end", values=(
-                row.get('Contact', ''),
-                row.get('timestamp', ''),
-                row.get('media_path', ''),
-                row.get('media_type', ''),
-                row.get('media_mime', '')
-            ))
+            self.audit_worker.cancel("media_audit")
+
+    def media_audit_job(self, job, media_df):
+        # Runs on the audit worker thread
+        audit = self.media_audit.audit(media_df['media_path'].unique(), should_stop=lambda: job.cancelled)
+        job.check()
+        audited, unique_counts = add_audit_columns(media_df, audit)
+        return media_df, audited, unique_counts
+
+    def on_media_audit_done(self, result):
+        media_df, audited, unique_counts = result
+        if media_df is not self.media_df:
+            return
+        self.media_df = audited
+        self.media_unique_counts = unique_counts
+        self.media_tree.extend_frame(audited)
+        self.update_media_summary()
+
+    def update_media_summary(self):
+        counts = self.media_counts
+        unique_counts = self.media_unique_counts
 
         # Clear previous summary widgets
         for widget in getattr(self, 'media_summary_widgets', []):
@@ -385,11 +880,13 @@ class ParsePalApp:
         self.media_summary_widgets = []
 
         # Media count per contact
-        if not self.media_df.empty:
-            counts = self.media_df['Contact'].value_counts()
+        if counts is not None and not counts.empty:
             summary = "Media count per contact:\n"
             for contact, count in counts.items():
-                summary += f"{contact}: {count}\n"
+                if unique_counts is not None:
+                    summary += f"{contact}: {count} ({unique_counts.get(contact, 0)} unique)\n"
+                else:
+                    summary += f"{contact}: {count}\n"
         else:
             summary = "No media found for current filter."
 
@@ -397,16 +894,6 @@ class ParsePalApp:
         label.pack(anchor="nw", padx=10, pady=(5, 0))
         self.media_summary_widgets = [label]
 
-        # Prioritize selected contacts at the top
-        selected_indices = self.contact_listbox.curselection()
-        if selected_indices:
-            selected_contacts = [self.contact_listbox.get(i) for i in selected_indices]
-            self.media_df['priority'] = self.media_df['Contact'].apply(lambda c: 0 if c in selected_contacts else 1)
-            self.media_df = self.media_df.sort_values(['priority', 'Contact', 'timestamp'])
-            self.media_df = self.media_df.drop(columns=['priority'])
-        else:
-            self.media_df = self.media_df.sort_values(['Contact', 'timestamp'])
-
 def run_app():
     root = tk.Tk()
 
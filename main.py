@@ -1,4 +1,10 @@
-from gui import run_app
+import sys
 
 if __name__ == "__main__":
-    run_app()
\ No newline at end of file
+    # With arguments run headless, without them start the GUI
+    if len(sys.argv) > 1:
+        from cli import main
+        sys.exit(main())
+
+    from gui import run_app
+    run_app()
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from cache import DEFAULT_CACHE_DIR
+from diagnostics import traced
+
+DEFAULT_AUDIT_DB = os.path.join(os.path.dirname(DEFAULT_CACHE_DIR), "media_audit.db")
+HASH_CHUNK_SIZE = 1024 ** 2
+STAT_BATCH_SIZE = 1000
+
+AUDIT_COLUMNS = ["exists", "size", "sha256"]
+
+def hash_file(path, chunk_size=HASH_CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _stat_batch(paths):
+    # (size, mtime_ns) per path, None for anything that isn't a readable file
+    results = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except (OSError, ValueError):
+            results.append(None)
+            continue
+        results.append((stat.st_size, stat.st_mtime_ns) if os.path.isfile(path) else None)
+    return results
+
+class MediaAudit:
+    # Stats every referenced media file and hashes the ones that could be
+    # duplicates, on a thread pool. Only files whose size matches another
+    # file's can share content, so files with a unique size are never read.
+    # Hashes are stored in a SQLite file keyed by path, size and mtime, so a
+    # media folder is hashed once and later audits only stat it.
+
+    def __init__(self, store_path=DEFAULT_AUDIT_DB, workers=8):
+        self.store_path = store_path
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def _connect(self):
+        if self.conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.store_path)), exist_ok=True)
+            self.conn = sqlite3.connect(self.store_path, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS media_hashes (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT)"
+            )
+            self.conn.commit()
+        return self.conn
+
+    def _stored_hashes(self, stats):
+        # {path: sha256} for the files whose size and mtime are unchanged
+        hashes = {}
+        paths = list(stats)
+        with self.lock:
+            conn = self._connect()
+            for start in range(0, len(paths), 500):
+                batch = paths[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT path, size, mtime_ns, sha256 FROM media_hashes WHERE path IN ({', '.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                for path, size, mtime_ns, sha256 in rows:
+                    if stats[path] == (size, mtime_ns):
+                        hashes[path] = sha256
+        return hashes
+
+    def _store_hashes(self, stats, hashes):
+        with self.lock:
+            conn = self._connect()
+            conn.executemany("INSERT OR REPLACE INTO media_hashes VALUES (?, ?, ?, ?)",
+                             [(path, *stats[path], sha256) for path, sha256 in hashes.items()])
+            conn.commit()
+
+    @traced("media_audit", rows=len)
+    def audit(self, paths, should_stop=None):
+        # DataFrame indexed by path with exists, size and sha256 (None when
+        # the file was not hashed). Returns None if should_stop() says so.
+        paths = list(dict.fromkeys(path for path in paths if isinstance(path, str) and path.strip()))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            batches = [paths[start:start + STAT_BATCH_SIZE] for start in range(0, len(paths), STAT_BATCH_SIZE)]
+            stats = {}
+            for batch, results in zip(batches, executor.map(_stat_batch, batches)):
+                stats.update(zip(batch, results))
+                if should_stop is not None and should_stop():
+                    return None
+
+            found = {path: stat for path, stat in stats.items() if stat is not None}
+            sizes = Counter(size for size, _ in found.values())
+            candidates = {path: stat for path, stat in found.items() if stat[0] > 0 and sizes[stat[0]] > 1}
+
+            hashes = self._stored_hashes(candidates)
+            to_hash = [path for path in candidates if path not in hashes]
+            new_hashes = {}
+            futures = {executor.submit(hash_file, path): path for path in to_hash}
+            for future, path in futures.items():
+                if should_stop is not None and should_stop():
+                    for pending in futures:
+                        pending.cancel()
+                    break
+                try:
+                    new_hashes[path] = future.result()
+                except OSError:
+                    # Vanished or unreadable since it was stat'ed
+                    continue
+            if new_hashes:
+                self._store_hashes(candidates, new_hashes)
+            if should_stop is not None and should_stop():
+                return None
+            hashes.update(new_hashes)
+
+        return pd.DataFrame({
+            "exists": [stats[path] is not None for path in paths],
+            "size": pd.array([None if stats[path] is None else stats[path][0] for path in paths], dtype="Int64"),
+            "sha256": np.array([hashes.get(path) for path in paths], dtype=object),
+        }, index=pd.Index(paths, name="media_path"), columns=AUDIT_COLUMNS)
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+def add_audit_columns(media_df, audit):
+    # Adds size, missing and duplicate columns to a media frame. A file is a
+    # duplicate when its content (same path, or same hash) is referenced by
+    # more than one row. Returns the frame and unique media counts per contact.
+    info = audit.reindex(media_df['media_path'].astype(object))
+    missing = ~info['exists'].fillna(False).to_numpy(dtype=bool)
+    # Unhashed files have a size no other file has, so their path identifies them
+    content = np.where(info['sha256'].notna(), info['sha256'].to_numpy(dtype=object), media_df['media_path'].to_numpy(dtype=object))
+    content = pd.Series(content, index=media_df.index).where(~missing)
+    audited = media_df.assign(
+        size=info['size'].array,
+        missing=missing,
+        duplicate=content.notna() & content.duplicated(keep=False),
+    )
+    unique_counts = content[~missing].groupby(media_df['Contact'][~missing], observed=True).nunique()
+    return audited, unique_counts
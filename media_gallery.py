@@ -0,0 +1,177 @@
+import os
+import tkinter as tk
+from tkinter import ttk
+
+TILE_SIZE = (128, 128)
+TILE_PADDING = 8
+CAPTION_HEIGHT = 18
+
+class MediaGallery(ttk.Frame):
+    # Thumbnail grid over a media frame. Like VirtualTreeview it keeps the
+    # frame as its backing store and only draws the tile rows scrolled into
+    # view; thumbnails come from a ThumbnailCache, whose LRU bounds memory,
+    # and decodes for tiles scrolled away are cancelled.
+    #
+    # on_select(position) is called when a tile is clicked, on_open(position)
+    # when it is double-clicked.
+
+    def __init__(self, master, thumbnails, on_select=None, on_open=None):
+        super().__init__(master)
+        self.thumbnails = thumbnails
+        self.on_select = on_select
+        self.on_open = on_open
+        self.df = None
+        self.first_row = 0
+        self.columns = 1
+        self.visible_rows = 1
+        self.selected_position = None
+        self.requested = set()
+        self.generation = 0
+        self.tile_images = {}
+        self.cell_width = TILE_SIZE[0] + TILE_PADDING
+        self.cell_height = TILE_SIZE[1] + CAPTION_HEIGHT + TILE_PADDING
+
+        self.canvas = tk.Canvas(self, highlightthickness=0, background="white")
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.canvas.bind("<Configure>", self.on_resize)
+        self.canvas.bind("<Button-1>", self.on_click)
+        self.canvas.bind("<Double-1>", self.on_double_click)
+        self.canvas.bind("<MouseWheel>", lambda event: self.scroll_by(-1 if event.delta > 0 else 1))
+        self.canvas.bind("<Button-4>", lambda event: self.scroll_by(-1))
+        self.canvas.bind("<Button-5>", lambda event: self.scroll_by(1))
+
+    @property
+    def row_count(self):
+        # Rows of tiles, not rows of the frame
+        if self.df is None:
+            return 0
+        return -(-len(self.df) // self.columns)
+
+    def set_frame(self, df):
+        self.df = df
+        self.first_row = 0
+        self.selected_position = None
+        self.render()
+
+    def selection(self):
+        return self.selected_position
+
+    def render(self):
+        self.canvas.delete("all")
+        self.generation += 1
+        self.tile_images = {}
+        max_first = max(self.row_count - self.visible_rows, 0)
+        self.first_row = min(max(self.first_row, 0), max_first)
+
+        start = self.first_row * self.columns
+        end = 0 if self.df is None else min(start + (self.visible_rows + 1) * self.columns, len(self.df))
+        paths = [] if self.df is None else self.df['media_path'].iloc[start:end].tolist()
+
+        # Tiles that scrolled out of view don't need decoding anymore
+        wanted = {path for path in paths if isinstance(path, str)}
+        self.thumbnails.cancel(self.requested - wanted, TILE_SIZE)
+        self.requested = wanted
+
+        for position, path in zip(range(start, end), paths):
+            self.draw_tile(position, path)
+
+        if self.row_count:
+            last_row = min(self.first_row + self.visible_rows, self.row_count)
+            self.scrollbar.set(self.first_row / self.row_count, last_row / self.row_count)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def tile_origin(self, position):
+        row, column = divmod(position, self.columns)
+        return column * self.cell_width + TILE_PADDING // 2, (row - self.first_row) * self.cell_height + TILE_PADDING // 2
+
+    def draw_tile(self, position, path):
+        x, y = self.tile_origin(position)
+        tag = f"tile{position}"
+        outline = "#3875d7" if position == self.selected_position else "#d0d0d0"
+        self.canvas.create_rectangle(x, y, x + TILE_SIZE[0], y + TILE_SIZE[1], outline=outline, width=2, tags=(tag,))
+        name = os.path.basename(path) if isinstance(path, str) else ""
+        self.canvas.create_text(x + TILE_SIZE[0] // 2, y + TILE_SIZE[1] + CAPTION_HEIGHT // 2,
+                                text=name[:20], font=("TkDefaultFont", 8), tags=(tag,))
+        if not isinstance(path, str) or not os.path.isfile(path):
+            self.canvas.create_text(x + TILE_SIZE[0] // 2, y + TILE_SIZE[1] // 2, text="Missing", fill="gray", tags=(tag,))
+            return
+
+        generation = self.generation
+
+        def on_thumbnail(photo, error):
+            # The grid may have been scrolled or redrawn in the meantime
+            if generation != self.generation:
+                return
+            if error is not None:
+                self.canvas.create_text(x + TILE_SIZE[0] // 2, y + TILE_SIZE[1] // 2, text="No preview", fill="gray", tags=(tag,))
+                return
+            # The canvas holds no reference, so keep visible images alive even
+            # after the cache evicts them
+            self.tile_images[position] = photo
+            self.canvas.create_image(x + TILE_SIZE[0] // 2, y + TILE_SIZE[1] // 2, image=photo, tags=(tag,))
+
+        self.thumbnails.get(path, on_thumbnail, TILE_SIZE)
+
+    def position_at(self, x, y):
+        column = int(x // self.cell_width)
+        row = int(y // self.cell_height) + self.first_row
+        position = row * self.columns + column
+        if column >= self.columns or self.df is None or position >= len(self.df):
+            return None
+        return position
+
+    def scroll_to(self, first_row):
+        if first_row != self.first_row:
+            self.first_row = first_row
+            self.render()
+
+    def scroll_by(self, rows):
+        self.scroll_to(self.first_row + rows)
+        return "break"
+
+    def see(self, position):
+        row = position // self.columns
+        if row < self.first_row or row >= self.first_row + self.visible_rows:
+            self.first_row = row - self.visible_rows // 2
+        self.selected_position = position
+        self.render()
+
+    def on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * self.row_count))
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= self.visible_rows
+            self.scroll_by(amount)
+
+    def on_resize(self, event):
+        columns = max(event.width // self.cell_width, 1)
+        visible_rows = max(event.height // self.cell_height, 1)
+        if (columns, visible_rows) != (self.columns, self.visible_rows):
+            # Keep the first visible tile in view when the grid reflows
+            first_position = self.first_row * self.columns
+            self.columns = columns
+            self.visible_rows = visible_rows
+            self.first_row = first_position // columns
+            self.render()
+
+    def on_click(self, event):
+        position = self.position_at(event.x, event.y)
+        if position is None or position == self.selected_position:
+            return
+        self.selected_position = position
+        self.render()
+        if self.on_select is not None:
+            self.on_select(position)
+
+    def on_double_click(self, event):
+        position = self.position_at(event.x, event.y)
+        if position is not None and self.on_open is not None:
+            self.on_open(position)
@@ -1,85 +1,354 @@
-import sqlite3
+from operator import itemgetter
+import numpy as np
 import pandas as pd
-from datetime import datetime
+from filters import sql_filter_clause
+from adapters import AUTO_DETECT, read_schema, get_adapter, is_supported
+from working_copy import prepare_working_copy
+from connections import readonly_connection
+from diagnostics import span
 
-def parse_db(db_path, app_name):
-    if app_name.lower() != "whatsapp":
-        raise NotImplementedError("Currently only WhatsApp is supported.")
+DEFAULT_CHUNK_SIZE = 50000
 
+# message_id is the source row id, stable across parses of the same DB
+OUTPUT_COLUMNS = ["Contact", "Message", "timestamp", "media_path", "media_mime", "media_type", "Direction", "message_id"]
+
+# Logical adapter columns (see adapters.py) fetched for normalization
+SOURCE_COLUMNS = ["id", "contact", "text", "timestamp", "from_me", "media_name", "media_url", "media_mime", "media_type"]
+
+def _build_query(cursor, app_name=AUTO_DETECT, since=None, until=None, filters=None):
+    # Resolves the app adapter for the open DB and returns a dict with its
+    # "adapter", "projection" (logical column -> SQL expression), and the
+    # "from", "where" and "params" selecting its message rows
+    schema = read_schema(cursor)
+    adapter = get_adapter(app_name, schema)
+    projection = adapter.projection(cursor, schema)
+
+    # Only rows with text or media are messages
+    content = [f"{projection[col]} IS NOT NULL" for col in adapter.content_columns if col in projection]
+    where_clause = " OR ".join(content) if content else "1=1"
+
+    # Restrict to rows between two high-water marks for incremental parsing
+    params = []
+    mark = _high_water_expression(projection)
+    if mark is not None and (since is not None or until is not None):
+        where_clause = f"({where_clause})"
+        if since is not None:
+            where_clause += f" AND {mark} > ?"
+            params.append(since)
+        if until is not None:
+            where_clause += f" AND {mark} <= ?"
+            params.append(until)
+
+    # Push the GUI filter state down into SQL
+    if filters is not None:
+        filter_clause, filter_params = sql_filter_clause(filters, projection)
+        if filter_clause is not None:
+            where_clause = f"({where_clause}) AND {filter_clause}"
+            params.extend(filter_params)
+
+    return {
+        "adapter": adapter,
+        "projection": projection,
+        "from": adapter.from_clause(schema),
+        "where": where_clause,
+        "params": params
+    }
+
+def _high_water_expression(projection):
+    # Column that only grows as new messages arrive
+    for col in ("id", "timestamp"):
+        if col in projection:
+            return projection[col]
+    return None
+
+def _select_list(projection):
+    # The SOURCE_COLUMNS this database has, aliased to their logical names
+    return ", ".join(f"{projection[col]} AS {col}" for col in SOURCE_COLUMNS if col in projection) or "NULL AS text"
+
+def _select_sql(query, chronological=True):
+    # The projected message rows, oldest first (ties in id order). Without a
+    # timestamp index (the legacy messages table has none) SQLite sorts
+    # every row before returning the first one, so callers that want rows
+    # at once pass chronological=False: rows then stream in id order, the
+    # table's rowid or INTEGER PRIMARY KEY, and sort_chronologically puts
+    # the joined frame in order afterwards.
+    projection = query["projection"]
+    if chronological and "timestamp" in projection:
+        order = " ORDER BY timestamp ASC, id ASC" if "id" in projection else " ORDER BY timestamp ASC"
+    else:
+        order = " ORDER BY id ASC" if "id" in projection else ""
+    return f"SELECT {_select_list(query['projection'])} FROM {query['from']} WHERE {query['where']}{order}"
+
+def _unindexed_joins(cursor, query):
+    # Joined tables that EXPLAIN QUERY PLAN shows being scanned (or indexed on
+    # the fly) instead of looked up through an index, which makes the parse
+    # quadratic in the message count
+    adapter = query["adapter"]
+    if not adapter.join_indexes:
+        return []
+    cursor.execute("EXPLAIN QUERY PLAN " + _select_sql(query), query["params"])
+    unindexed = []
+    for row in cursor.fetchall():
+        # "SCAN jid" on current SQLite versions, "SCAN TABLE jid" on older ones
+        words = [word for word in row[-1].split() if word != "TABLE"]
+        if len(words) < 2 or words[0] not in ("SCAN", "SEARCH") or words[1] == adapter.table:
+            continue
+        if words[0] == "SCAN" or "AUTOMATIC" in words:
+            unindexed.append(words[1])
+    return unindexed
+
+def high_water_mark(db_path, app_name=AUTO_DETECT):
+    # Largest message id (or timestamp) currently in the DB, None if empty
     try:
-        conn = sqlite3.connect(db_path)
+        with readonly_connection(db_path) as conn:
+            cursor = conn.cursor()
+            query = _build_query(cursor, app_name)
+            mark = _high_water_expression(query["projection"])
+            if mark is None:
+                return None
+            cursor.execute(f"SELECT MAX({mark}) FROM {query['adapter'].table}")
+            return cursor.fetchone()[0]
+
+    except Exception as e:
+        raise RuntimeError(f"Error parsing DB: {e}")
+
+def _indexed_source(db_path, app_name):
+    # db_path, or a working copy with the join indexes when the DB lacks them
+    with readonly_connection(db_path) as conn:
         cursor = conn.cursor()
+        if not _unindexed_joins(cursor, _build_query(cursor, app_name)):
+            return db_path
+    with span("working_copy", db=db_path):
+        return prepare_working_copy(db_path, app_name=app_name)
 
-        # Get columns of messages table
-        cursor.execute("PRAGMA table_info(messages);")
-        table_info = cursor.fetchall()
-        available_cols = [col[1] for col in table_info]
-
-        # Columns to fetch if they exist
-        desired_cols = [
-            "key_remote_jid",
-            "data",
-            "timestamp",
-            "media_name",
-            "media_url",
-            "media_mime_type",
-            "media_wa_type",
-            "key_from_me"
-        ]
-
-        selected_cols = [col for col in desired_cols if col in available_cols]
-
-        # Build WHERE clause for messages with text or media
-        where_clauses = []
-        if "data" in available_cols:
-            where_clauses.append("data IS NOT NULL")
-        if "media_name" in available_cols:
-            where_clauses.append("media_name IS NOT NULL")
-        where_clause = " OR ".join(where_clauses) if where_clauses else "1=1"
-
-        query = f"SELECT {', '.join(selected_cols)} FROM messages WHERE {where_clause} ORDER BY timestamp ASC"
-        cursor.execute(query)
-        rows = cursor.fetchall()
-
-        results = []
-        for row in rows:
-            row_dict = dict(zip(selected_cols, row))
-
-            timestamp = row_dict.get("timestamp")
-            dt = None
-            if timestamp is not None:
-                try:
-                    # WhatsApp stores timestamp in ms since epoch
-                    if isinstance(timestamp, (int, float)):
-                        if timestamp > 1e12:
-                            dt = datetime.utcfromtimestamp(timestamp / 1000)
-                        elif timestamp > 1e9:
-                            dt = datetime.utcfromtimestamp(timestamp)
-                except Exception:
-                    dt = None
-
-            media_path = row_dict.get("media_name") or row_dict.get("media_url")
-
-            direction = None
-            if "key_from_me" in row_dict:
-                direction = "Sent" if row_dict["key_from_me"] == 1 else "Received"
-
-            results.append({
-                "Contact": row_dict.get("key_remote_jid"),
-                "Message": row_dict.get("data"),
-                "timestamp": dt,
-                "media_path": media_path,
-                "media_mime": row_dict.get("media_mime_type"),
-                "media_type": row_dict.get("media_wa_type"),
-                "Direction": direction
-            })
-
-        df = pd.DataFrame(results)
-        return df
+# Largest timestamp datetime.utcfromtimestamp can represent (year 9999), in microseconds
+MAX_TIMESTAMP_US = 253402300800 * 1000000
+
+# Columns loaded as float arrays when every value is a number (or NULL)
+NUMERIC_COLUMNS = ("timestamp", "from_me")
+NUMERIC_TYPES = {int, float, type(None)}
+
+def _raw_columns(selected_cols, rows):
+    # Transpose the fetched tuples into one object array per source column
+    columns = {}
+    for position, name in enumerate(selected_cols):
+        values = np.fromiter(map(itemgetter(position), rows), dtype=object, count=len(rows))
+        if name in NUMERIC_COLUMNS and set(map(type, values)) <= NUMERIC_TYPES:
+            values = values.astype("float64")
+        columns[name] = values
+    return columns
+
+def _empty_column(length):
+    return np.full(length, None, dtype=object)
+
+def _text_column(values):
+    # Let pandas infer the dtype, as it did for the per-row dicts. The array
+    # is a fresh one, so there is no need for pandas to copy it.
+    return pd.Series(values, copy=False)
+
+def _normalize_timestamps(raw, length):
+    if "timestamp" not in raw:
+        return pd.Series(_empty_column(length))
+
+    values = raw["timestamp"]
+    if values.dtype == object:
+        # Mixed column: only int/float values are timestamps, everything else is None
+        numeric = np.fromiter((type(v) in (int, float) for v in values), dtype=bool, count=length)
+        values = np.where(numeric, values, np.nan).astype("float64")
+
+    # WhatsApp stores timestamp in ms since epoch, older rows may be in seconds
+    micros = np.full(length, np.nan)
+    is_ms = values > 1e12
+    is_s = ~is_ms & (values > 1e9)
+    micros[is_ms] = np.round(values[is_ms] * 1000)
+    micros[is_s] = np.round(values[is_s] * 1000000)
+
+    valid = ~np.isnan(micros) & (micros < MAX_TIMESTAMP_US)
+    if not valid.any():
+        return pd.Series(_empty_column(length))
+
+    stamps = np.full(length, np.datetime64("NaT"), dtype="datetime64[us]")
+    stamps[valid] = micros[valid].astype("int64").astype("datetime64[us]")
+    return pd.Series(stamps)
+
+def _normalize_media_path(raw, length):
+    media_name = raw.get("media_name")
+    media_url = raw["media_url"] if "media_url" in raw else _empty_column(length)
+    if media_name is None:
+        return media_url
+    # `media_name or media_url`: fall back whenever the name is falsy
+    return np.where(media_name.astype(bool), media_name, media_url)
+
+def _normalize_direction(raw, length):
+    if "from_me" not in raw:
+        return _empty_column(length)
+    sent = raw["from_me"] == 1
+    return np.where(sent, "Sent", "Received").astype(object)
+
+def _normalize_ids(raw, length):
+    if "id" not in raw:
+        return _empty_column(length)
+    try:
+        return raw["id"].astype("int64")
+    except (TypeError, ValueError):
+        return raw["id"]
+
+def _normalize_rows(selected_cols, rows):
+    # Load the raw column arrays straight into NumPy and normalize column-wise
+    length = len(rows)
+    raw = _raw_columns(selected_cols, rows)
+
+    def text(name):
+        return _text_column(raw[name] if name in raw else _empty_column(length))
+
+    return pd.DataFrame({
+        "Contact": text("contact"),
+        "Message": text("text"),
+        "timestamp": _normalize_timestamps(raw, length),
+        "media_path": _text_column(_normalize_media_path(raw, length)),
+        "media_mime": text("media_mime"),
+        "media_type": text("media_type"),
+        "Direction": _text_column(_normalize_direction(raw, length)),
+        "message_id": _text_column(_normalize_ids(raw, length))
+    }, copy=False)
+
+def iter_parse_db(db_path, app_name=AUTO_DETECT, chunk_size=DEFAULT_CHUNK_SIZE, progress_callback=None, since=None,
+                  until=None, filters=None, chronological=True):
+    # Yields DataFrame chunks of at most chunk_size rows, so memory stays bounded
+    # and callers can show the first rows before the whole DB has been read.
+    # progress_callback(rows_done, total_rows) is called after every chunk
+    # has been handed out.
+    # since/until limit the rows to those between two high_water_mark() values,
+    # filters (see filters.empty_filters) are applied in SQL. app_name picks
+    # the adapter, "Auto-detect" goes by the DB schema. Rows come oldest
+    # first; chronological=False streams them in id order instead, see
+    # _select_sql.
+    if not is_supported(app_name):
+        raise NotImplementedError(f"{app_name} is not supported.")
+
+    try:
+        with readonly_connection(_indexed_source(db_path, app_name)) as conn:
+            cursor = conn.cursor()
+            query = _build_query(cursor, app_name, since, until, filters)
+
+            with span("sql.execute", db=db_path, app=query["adapter"].app):
+                cursor.execute(_select_sql(query, chronological), query["params"])
+            selected_cols = [description[0] for description in cursor.description]
+
+            rows_done = 0
+            total_rows = None
+            while True:
+                with span("sql.fetch") as fields:
+                    rows = cursor.fetchmany(chunk_size)
+                    fields["rows"] = len(rows)
+                if not rows:
+                    break
+                rows_done += len(rows)
+                with span("normalize", rows=len(rows)):
+                    chunk = _normalize_rows(selected_cols, rows)
+                yield chunk
+                if progress_callback is not None:
+                    # Counted once the first rows are out, so the count
+                    # doesn't hold them back
+                    if total_rows is None and len(rows) < chunk_size:
+                        total_rows = rows_done
+                    elif total_rows is None:
+                        with span("sql.count", db=db_path):
+                            count = conn.execute(f"SELECT COUNT(*) FROM {query['from']} WHERE {query['where']}",
+                                                 query["params"])
+                            total_rows = count.fetchone()[0]
+                    progress_callback(rows_done, total_rows)
 
     except Exception as e:
         raise RuntimeError(f"Error parsing DB: {e}")
 
-    finally:
-        if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+# Few distinct values per column: stored as categoricals, a small integer code
+# per row instead of a string each
+CATEGORY_COLUMNS = ["Contact", "Direction", "media_type", "media_mime", "source_db"]
+TEXT_COLUMNS = ["Message", "media_path"]
+
+def _text_dtype():
+    # Arrow-backed strings when pyarrow is installed. Since pandas 3 that is
+    # what the default "str" dtype already uses.
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return None
+    return "str" if int(pd.__version__.split(".")[0]) >= 3 else "string[pyarrow]"
+
+TEXT_DTYPE = _text_dtype()
+
+def compact_frame(df):
+    # Memory-lean dtypes for a parsed frame: categoricals for the
+    # low-cardinality columns and Arrow strings for the free text
+    dtypes = {col: "category" for col in CATEGORY_COLUMNS if col in df and not isinstance(df[col].dtype, pd.CategoricalDtype)}
+    if TEXT_DTYPE is not None:
+        dtypes.update({col: TEXT_DTYPE for col in TEXT_COLUMNS if col in df and df[col].dtype != TEXT_DTYPE})
+    return df.astype(dtypes) if dtypes else df
+
+def concat_chunks(chunks):
+    # Joins parsed chunks into one compact frame (see compact_frame)
+    with span("concat") as fields:
+        df = _concat_chunks(chunks)
+        fields["rows"] = len(df)
+    return df
+
+def _concat_chunks(chunks):
+    chunks = [chunk for chunk in chunks if not chunk.empty]
+    if not chunks:
+        return pd.DataFrame(columns=OUTPUT_COLUMNS)
+    if len(chunks) == 1:
+        return compact_frame(chunks[0])
+
+    # A chunk where a column is all None gets object dtype; cast it to the dtype
+    # the other chunks inferred so the concatenated column keeps it
+    dtypes = {}
+    for chunk in chunks:
+        for col, dtype in chunk.dtypes.items():
+            if dtype != object:
+                dtypes.setdefault(col, dtype)
+    chunks = [
+        chunk.astype({col: dtype for col, dtype in dtypes.items() if chunk[col].dtype == object and chunk[col].isna().all()})
+        for chunk in chunks
+    ]
+    return compact_frame(pd.concat(chunks, ignore_index=True))
+
+def sort_chronologically(df):
+    # Puts a frame read with chronological=False in the order
+    # ORDER BY timestamp, id gives: missing timestamps first, then oldest
+    # first. Rows come in id order, so a stable sort keeps ties in id order.
+    # Returns df itself when it is in order already, the usual case.
+    timestamps = df['timestamp'].to_numpy()
+    if len(df) < 2 or not np.issubdtype(timestamps.dtype, np.datetime64):
+        return df
+    # NaT is the smallest int64, so it sorts first like NULL in SQLite
+    keys = timestamps.view("int64")
+    if (keys[1:] >= keys[:-1]).all():
+        return df
+    with span("sort", rows=len(df)):
+        return df.take(np.argsort(keys, kind="stable")).reset_index(drop=True)
+
+def parse_db(db_path, app_name=AUTO_DETECT):
+    return concat_chunks(iter_parse_db(db_path, app_name))
+
+def parse_db_incremental(db_path, app_name=AUTO_DETECT, previous_df=None, since=None):
+    # Parses only the messages added after the `since` high-water mark and
+    # appends them to previous_df. Returns (frame, new mark to pass as `since`
+    # on the next refresh, full). full is False when the new rows were only
+    # appended, so previous_df's rows kept their positions; when True,
+    # anything keyed by row position (the search index) must be rebuilt.
+    # Edits and deletions of already ingested rows are not picked up, do a
+    # full parse_db for those.
+    until = high_water_mark(db_path, app_name)
+    if until == since and previous_df is not None:
+        return previous_df, since, False
+    # A DB that is empty now or whose mark went back was replaced (e.g.
+    # re-extracted), so previous_df no longer describes it
+    if previous_df is None or since is None or until is None or until < since:
+        return concat_chunks(iter_parse_db(db_path, app_name, until=until)), until, True
+
+    new_rows = concat_chunks(iter_parse_db(db_path, app_name, since=since, until=until))
+    # New messages are usually the newest, unless a device clock was off
+    appended = concat_chunks([previous_df, new_rows])
+    df = sort_chronologically(appended)
+    return df, until, df is not appended
@@ -0,0 +1,27 @@
+from parser import iter_parse_db, concat_chunks, _build_query
+from filters import parse_date_filters
+from adapters import AUTO_DETECT
+from connections import readonly_connection
+from diagnostics import traced
+
+def list_contacts(db_path, app_name=AUTO_DETECT):
+    # Distinct contacts of the messages parse_db would load
+    try:
+        with readonly_connection(db_path) as conn:
+            cursor = conn.cursor()
+            query = _build_query(cursor, app_name)
+            contact = query["projection"].get("contact")
+            if contact is None:
+                return []
+            cursor.execute(f"SELECT DISTINCT {contact} FROM {query['from']} WHERE ({query['where']}) AND {contact} IS NOT NULL", query["params"])
+            return sorted(row[0] for row in cursor.fetchall())
+
+    except Exception as e:
+        raise RuntimeError(f"Error parsing DB: {e}")
+
+@traced("query", rows=lambda result: len(result[0]))
+def query_messages(db_path, app_name, filters):
+    # Loads only the messages matching filters. Returns (frame, date_error)
+    # like filters.filter_messages, with the same case-insensitive text search.
+    _, _, date_error = parse_date_filters(filters)
+    return concat_chunks(iter_parse_db(db_path, app_name, filters=filters)), date_error
@@ -1,24 +1,65 @@
 import sqlite3
 import os
 import random
-from datetime import datetime, timedelta
-
-def make_sample_whatsapp_db(filename="sample_dbs/msgstore.db", message_count=1000):
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
-    media_folder = os.path.join(os.path.dirname(filename), "media")
-    os.makedirs(media_folder, exist_ok=True)
-
-    # Place some sample images in media_folder before running this script (important)
-    sample_images = [os.path.join(media_folder, f) for f in os.listdir(media_folder) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
-    if not sample_images:
-        print(f"⚠️  No images found in {media_folder}. Add some .jpg or .png files for media messages.")
-    
-    if os.path.exists(filename):
-        os.remove(filename)
+from datetime import datetime, timezone
 
-    conn = sqlite3.connect(filename)
-    cur = conn.cursor()
+SAMPLE_TEXTS = [
+    "Hello!", "How are you?", "What's up?", "See you soon.", "Good morning!",
+    "Thanks!", "Okay", "I'll be there.", "Can't talk now", "Yes", "No", "Maybe",
+    "Sure thing", "That's fine", "Haha", "Lol", "Nice!", "Alright", "On my way", "Great!"
+]
+
+IMAGE_MIME_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
+
+# Messages are generated inside SQLite from their row number, hashed with
+# constants drawn from the seed: the same seed always gives the same
+# database, and 10M rows take seconds instead of a Python loop per row
+HASH_PRIME = 2147483647
+
+def _media_paths(media_folder, count=50):
+    # Images in media_folder when there are any, so previews show something,
+    # otherwise made-up paths there (the files don't need to exist)
+    if os.path.isdir(media_folder):
+        images = sorted(f for f in os.listdir(media_folder) if os.path.splitext(f)[1].lower() in IMAGE_MIME_TYPES)
+        if images:
+            return [os.path.abspath(os.path.join(media_folder, f)) for f in images]
+    return [os.path.abspath(os.path.join(media_folder, f"IMG-{n:05d}.jpg")) for n in range(count)]
+
+def _create_sample_tables(cur, rng, contact_count, media_folder):
+    cur.execute("CREATE TEMP TABLE sample_contact (idx INTEGER PRIMARY KEY, jid TEXT)")
+    contacts = rng.sample(range(10000, 100000), contact_count)
+    cur.executemany("INSERT INTO sample_contact VALUES (?, ?)", [(i, f"{user}@s.whatsapp.net") for i, user in enumerate(contacts)])
+
+    cur.execute("CREATE TEMP TABLE sample_text (idx INTEGER PRIMARY KEY, text TEXT)")
+    cur.executemany("INSERT INTO sample_text VALUES (?, ?)", list(enumerate(SAMPLE_TEXTS)))
 
+    cur.execute("CREATE TEMP TABLE sample_media (idx INTEGER PRIMARY KEY, path TEXT, mime TEXT)")
+    media = [(i, path, IMAGE_MIME_TYPES[os.path.splitext(path)[1].lower()]) for i, path in enumerate(_media_paths(media_folder))]
+    cur.executemany("INSERT INTO sample_media VALUES (?, ?, ?)", media)
+    return len(contacts), len(SAMPLE_TEXTS), len(media)
+
+def _sample_rows_sql(rng, message_count, media_ratio, counts):
+    # SELECT over i = 0..message_count-1 with the per-message choices: contact,
+    # text and media index, from_me, has_media and a rising ms timestamp
+    contact_count, text_count, media_count = counts
+    a1, b1, a2, b2 = (rng.randrange(1, HASH_PRIME) for _ in range(4))
+    base_ms = int(datetime(2023, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+    gap_ms = 30000
+    return f"""
+        WITH RECURSIVE seq(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM seq WHERE i < {message_count - 1}),
+        h1 AS (SELECT i, (i * {a1} + {b1}) % {HASH_PRIME} AS h FROM seq),
+        h2 AS (SELECT i, h AS h1, (h * {a2} + {b2}) % {HASH_PRIME} AS h2 FROM h1)
+        SELECT i,
+               h1 % {contact_count} AS contact_idx,
+               h2 % {text_count} AS text_idx,
+               (h1 / 7) % {media_count} AS media_idx,
+               (h2 / 11) % 2 AS from_me,
+               (h2 / 13) % 1000 < {int(media_ratio * 1000)} AS has_media,
+               {base_ms} + i * {gap_ms} + h1 % {gap_ms} AS timestamp
+        FROM h2 WHERE {message_count} > 0
+    """
+
+def _create_legacy_schema(cur, rows_sql):
     cur.execute("""
         CREATE TABLE messages (
             _id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -31,36 +72,119 @@ def make_sample_whatsapp_db(filename="sample_dbs/msgstore.db", message_count=100
             media_wa_type TEXT
         );
     """)
+    cur.execute(f"""
+        INSERT INTO messages (key_remote_jid, data, timestamp, key_from_me, media_name, media_mime_type, media_wa_type)
+        SELECT c.jid, t.text, r.timestamp, r.from_me,
+               CASE WHEN r.has_media THEN m.path END,
+               CASE WHEN r.has_media THEN m.mime END,
+               CASE WHEN r.has_media THEN 'image' END
+        FROM ({rows_sql}) r
+        JOIN sample_contact c ON c.idx = r.contact_idx
+        JOIN sample_text t ON t.idx = r.text_idx
+        JOIN sample_media m ON m.idx = r.media_idx
+    """)
+
+def _create_modern_schema(cur, rows_sql):
+    # Current msgstore.db layout: messages reference their chat, chats their
+    # jid, and media lives in message_media
+    cur.executescript("""
+        CREATE TABLE jid (
+            _id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user TEXT,
+            server TEXT,
+            agent INTEGER,
+            device INTEGER,
+            type INTEGER,
+            raw_string TEXT
+        );
+        CREATE UNIQUE INDEX jid_key_index ON jid (raw_string);
+        CREATE TABLE chat (
+            _id INTEGER PRIMARY KEY AUTOINCREMENT,
+            jid_row_id INTEGER UNIQUE,
+            hidden INTEGER,
+            subject TEXT,
+            created_timestamp INTEGER
+        );
+        CREATE TABLE message (
+            _id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_row_id INTEGER NOT NULL,
+            from_me INTEGER NOT NULL,
+            key_id TEXT NOT NULL,
+            sender_jid_row_id INTEGER,
+            status INTEGER,
+            timestamp INTEGER,
+            received_timestamp INTEGER,
+            message_type INTEGER,
+            text_data TEXT,
+            starred INTEGER,
+            sort_id INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX message_sort_id_index ON message (chat_row_id, sort_id);
+        CREATE TABLE message_media (
+            message_row_id INTEGER PRIMARY KEY,
+            chat_row_id INTEGER,
+            file_path TEXT,
+            file_size INTEGER,
+            message_url TEXT,
+            mime_type TEXT,
+            media_name TEXT,
+            width INTEGER,
+            height INTEGER
+        );
+        INSERT INTO jid (_id, user, server, agent, device, type, raw_string)
+        SELECT idx + 1, substr(jid, 1, instr(jid, '@') - 1), 's.whatsapp.net', 0, 0, 0, jid FROM sample_contact;
+        INSERT INTO chat (_id, jid_row_id, hidden, created_timestamp) SELECT _id, _id, 0, 0 FROM jid;
+    """)
+    # message._id is i + 1, so the media rows can be matched back to it
+    cur.execute(f"""
+        INSERT INTO message (_id, chat_row_id, from_me, key_id, status, timestamp, received_timestamp, message_type, text_data, starred, sort_id)
+        SELECT r.i + 1, r.contact_idx + 1, r.from_me, printf('%016X', r.i), 0, r.timestamp, r.timestamp, r.has_media, t.text, 0, r.i
+        FROM ({rows_sql}) r
+        JOIN sample_text t ON t.idx = r.text_idx
+    """)
+    cur.execute(f"""
+        INSERT INTO message_media (message_row_id, chat_row_id, file_path, mime_type)
+        SELECT r.i + 1, r.contact_idx + 1, m.path, m.mime
+        FROM ({rows_sql}) r
+        JOIN sample_media m ON m.idx = r.media_idx
+        WHERE r.has_media
+    """)
+
+SCHEMAS = {"legacy": _create_legacy_schema, "modern": _create_modern_schema}
 
-    contacts = [f"{random.randint(10000,99999)}@s.whatsapp.net" for _ in range(10)]
-
-    base_time = datetime(2023, 1, 1)
-    messages = []
-    for i in range(message_count):
-        contact = random.choice(contacts)
-        text = random.choice([
-            "Hello!", "How are you?", "What's up?", "See you soon.", "Good morning!",
-            "Thanks!", "Okay", "I'll be there.", "Can't talk now", "Yes", "No", "Maybe",
-            "Sure thing", "That's fine", "Haha", "Lol", "Nice!", "Alright", "On my way", "Great!"
-        ])
-        timestamp = int((base_time + timedelta(seconds=i * random.randint(30, 300))).timestamp() * 1000)
-        key_from_me = random.randint(0, 1)  # 0 = received, 1 = sent
-
-        # Randomly assign media to some messages
-        if random.random() < 0.3:  # 30% chance to add media
-            media_file = os.path.abspath(random.choice(sample_images))
-            media_name = media_file
-            media_mime_type = "image/jpeg" if media_name.lower().endswith('.jpg') or media_name.lower().endswith('.jpeg') else "image/png"
-            media_wa_type = "image"
-            messages.append((contact, text, timestamp, key_from_me, media_name, media_mime_type, media_wa_type))
-        else:
-            messages.append((contact, text, timestamp, key_from_me, None, None, None))
-
-    cur.executemany("INSERT INTO messages (key_remote_jid, data, timestamp, key_from_me, media_name, media_mime_type, media_wa_type) VALUES (?, ?, ?, ?, ?, ?, ?)", messages)
-    conn.commit()
-    conn.close()
+def make_synthetic_db(filename, message_count, schema="legacy", seed=0, contact_count=50, media_ratio=0.3, media_folder=None):
+    # Deterministic WhatsApp msgstore.db in the legacy (messages) or modern
+    # (message/chat/jid/message_media) schema. Media rows point at images in
+    # media_folder (default: "media" next to the DB) when it has any,
+    # otherwise at paths that don't exist.
+    folder = os.path.dirname(os.path.abspath(filename))
+    os.makedirs(folder, exist_ok=True)
+    if media_folder is None:
+        media_folder = os.path.join(folder, "media")
+    if os.path.exists(filename):
+        os.remove(filename)
 
+    rng = random.Random(seed)
+    conn = sqlite3.connect(filename)
+    try:
+        # Nothing to recover if generation fails halfway, skip the journal
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        cur = conn.cursor()
+        counts = _create_sample_tables(cur, rng, contact_count, media_folder)
+        SCHEMAS[schema](cur, _sample_rows_sql(rng, message_count, media_ratio, counts))
+        conn.commit()
+    finally:
+        conn.close()
+    return filename
+
+def make_sample_whatsapp_db(filename="sample_dbs/msgstore.db", message_count=1000, seed=0):
+    make_synthetic_db(filename, message_count, "legacy", seed=seed, contact_count=10)
     print(f"✅ Created {message_count} fake WhatsApp messages with key_from_me in {filename}")
 
+def make_sample_modern_whatsapp_db(filename="sample_dbs/msgstore_modern.db", message_count=1000, seed=0):
+    make_synthetic_db(filename, message_count, "modern", seed=seed, contact_count=10)
+    print(f"✅ Created {message_count} fake WhatsApp messages (modern schema) in {filename}")
+
 if __name__ == "__main__":
     make_sample_whatsapp_db()
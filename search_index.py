@@ -0,0 +1,166 @@
+import os
+import re
+import sqlite3
+import threading
+import numpy as np
+from diagnostics import traced
+
+INDEX_BATCH_SIZE = 50000
+
+# The trigram tokenizer (SQLite 3.34+) indexes every 3-character substring
+TRIGRAM_SUPPORTED = sqlite3.sqlite_version_info >= (3, 34, 0)
+MIN_QUERY_LENGTH = 3
+
+# "quoted phrase", word* prefix or plain word
+QUERY_TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+# Token characters of the unicode61 tokenizer: letters and digits
+WORD = re.compile(r"[^\W_]+")
+
+def parse_word_query(text):
+    # Search box text in "Words" mode as [(tokens, prefix)] parts, all of
+    # which must match: a "quoted phrase" is one part, a plain word one part
+    # per token, and a trailing * makes the last token a prefix
+    parts = []
+    for phrase, word in QUERY_TOKEN.findall(text.lower()):
+        if phrase:
+            tokens = WORD.findall(phrase)
+            if tokens:
+                parts.append((tuple(tokens), False))
+            continue
+        tokens = WORD.findall(word)
+        parts.extend(((token,), False) for token in tokens)
+        if tokens and word.endswith("*"):
+            parts[-1] = (parts[-1][0], True)
+    return parts
+
+def build_match_query(parts):
+    # FTS5 MATCH expression for parse_word_query parts. Every token is
+    # quoted so user input can never be a syntax error.
+    return " AND ".join('"' + " ".join(tokens) + '"' + ("*" if prefix else "") for tokens, prefix in parts)
+
+def word_pattern(tokens, prefix):
+    # Regex twin of one part for the scan and SQL (filters.py): the tokens
+    # in a row with only separators between them, on lowercased text
+    pattern = r"(?<![^\W_])" + r"[\W_]+".join(re.escape(token) for token in tokens)
+    return pattern + (r"[^\W_]*" if prefix else r"(?![^\W_])")
+
+class MessageIndex:
+    # SQLite FTS5 indexes over the Message column of a parsed frame: a
+    # trigram one for "Substring" searches and a unicode61 one, with its
+    # fts5vocab postings, for "Words" searches (token, prefix* and "phrase").
+    # Rowids are row positions in that frame, so hits can be taken with
+    # .iloc. The index only narrows down the rows to check: filters.py runs
+    # the same test as its scan on them, so results don't depend on whether
+    # the index is built yet.
+    # Pass a path to keep the index on disk between sessions; rows appended
+    # by an incremental refresh are indexed by calling update() again.
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # Indexes from older versions lack a table or tokenize differently, start over
+        tables = dict(self.conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table'").fetchall())
+        if "messages_words" not in tables or (TRIGRAM_SUPPORTED and "trigram" not in (tables.get("messages_fts") or "")):
+            for table in ("messages_terms", "messages_words", "messages_fts", "index_info"):
+                self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+        if TRIGRAM_SUPPORTED:
+            self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(message, tokenize='trigram case_sensitive 0')")
+        self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages_words USING fts5(message, tokenize='unicode61 remove_diacritics 0')")
+        self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages_terms USING fts5vocab(messages_words, 'instance')")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS index_info (row_count INTEGER)")
+        if self.conn.execute("SELECT COUNT(*) FROM index_info").fetchone()[0] == 0:
+            self.conn.execute("INSERT INTO index_info VALUES (0)")
+        self.conn.commit()
+
+    @property
+    def row_count(self):
+        with self.lock:
+            return self.conn.execute("SELECT row_count FROM index_info").fetchone()[0]
+
+    @traced("search_index")
+    def update(self, df, should_stop=None):
+        # Indexes the rows of df past the ones already indexed. If df is shorter
+        # than the index it is a different frame, so start over.
+        indexed = self.row_count
+        if indexed > len(df):
+            self.reset()
+            indexed = 0
+
+        messages = df['Message']
+        for start in range(indexed, len(df), INDEX_BATCH_SIZE):
+            if should_stop is not None and should_stop():
+                return
+            batch = messages.iloc[start:start + INDEX_BATCH_SIZE]
+            rows = [(start + offset, text) for offset, text in enumerate(batch.tolist()) if isinstance(text, str)]
+            end = start + len(batch)
+            with self.lock:
+                if TRIGRAM_SUPPORTED:
+                    self.conn.executemany("INSERT INTO messages_fts(rowid, message) VALUES (?, ?)", rows)
+                self.conn.executemany("INSERT INTO messages_words(rowid, message) VALUES (?, ?)", rows)
+                self.conn.execute("UPDATE index_info SET row_count = ?", (end,))
+                self.conn.commit()
+
+    def reset(self):
+        with self.lock:
+            if TRIGRAM_SUPPORTED:
+                self.conn.execute("DELETE FROM messages_fts")
+            self.conn.execute("DELETE FROM messages_words")
+            self.conn.execute("UPDATE index_info SET row_count = 0")
+            self.conn.commit()
+
+    def candidates(self, text):
+        # Sorted row positions of the messages that may contain text, or
+        # None when text is too short for trigrams (or SQLite has no trigram
+        # tokenizer) and every row must be checked. The caller still checks
+        # each candidate.
+        if len(text) < MIN_QUERY_LENGTH or not TRIGRAM_SUPPORTED:
+            return None
+        query = '"' + text.replace('"', '""') + '"'
+        with self.lock:
+            rows = self.conn.execute("SELECT rowid FROM messages_fts WHERE messages_fts MATCH ? ORDER BY rowid", (query,)).fetchall()
+        return np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+
+    def search(self, parts):
+        # Sorted row positions matching every parse_word_query part
+        with self.lock:
+            rows = self.conn.execute("SELECT rowid FROM messages_words WHERE messages_words MATCH ? ORDER BY rowid",
+                                     (build_match_query(parts),)).fetchall()
+        return np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+
+    def term_positions(self, term, prefix=False):
+        # Row position of every occurrence of a single token (or token prefix)
+        with self.lock:
+            if prefix:
+                rows = self.conn.execute(
+                    "SELECT doc FROM messages_terms WHERE term >= ? AND term < ?", (term, term + "\U0010ffff")
+                ).fetchall()
+            else:
+                rows = self.conn.execute("SELECT doc FROM messages_terms WHERE term = ?", (term,)).fetchall()
+        return np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+
+    def keyword_count(self, tokens, prefix, positions=None):
+        # Occurrences of a single-token keyword from the postings, optionally
+        # only in the given row positions. None for a phrase, which the
+        # postings can't count.
+        if len(tokens) != 1:
+            return None
+        hits = self.term_positions(tokens[0], prefix)
+        if positions is None:
+            return len(hits)
+        return int(np.isin(hits, positions).sum())
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def open_index(path=None):
+    # On-disk index at path (created if missing, recreated if unreadable),
+    # or an in-memory one when path is None
+    if path is None:
+        return MessageIndex()
+    try:
+        return MessageIndex(path)
+    except sqlite3.Error:
+        os.remove(path)
+        return MessageIndex(path)
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageTk
+
+DEFAULT_THUMBNAIL_DIR = os.path.join(os.path.expanduser("~"), ".parsepal", "thumbnails")
+PREVIEW_SIZE = (400, 400)
+
+def _store_path(store_dir, path, mtime_ns, size):
+    key = f"{os.path.abspath(path)}\0{mtime_ns}\0{size[0]}x{size[1]}"
+    return os.path.join(store_dir, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".png")
+
+def decode_thumbnail(path, size, store_dir=None):
+    # Runs on a pool thread. Returns a downscaled PIL image, read from the
+    # on-disk store when this path/mtime/size was decoded before.
+    mtime_ns = os.stat(path).st_mtime_ns
+    stored = _store_path(store_dir, path, mtime_ns, size) if store_dir else None
+    if stored and os.path.isfile(stored):
+        try:
+            with Image.open(stored) as img:
+                img.load()
+                return img.copy()
+        except OSError:
+            os.remove(stored)
+
+    with Image.open(path) as img:
+        # Let the JPEG decoder downscale by a power of two while decoding
+        img.draft("RGB", size)
+        img.thumbnail(size)
+        thumb = img.copy()
+
+    if stored:
+        os.makedirs(store_dir, exist_ok=True)
+        tmp_path = stored + ".tmp"
+        thumb.save(tmp_path, format="PNG")
+        os.replace(tmp_path, stored)
+    return thumb
+
+class ThumbnailCache:
+    # Decodes thumbnails on a thread pool and keeps the most recently used
+    # PhotoImages in memory. Callbacks run on the Tk thread: results are
+    # handed over through a queue drained with root.after, since PhotoImages
+    # may only be created there.
+
+    def __init__(self, root, store_dir=DEFAULT_THUMBNAIL_DIR, max_items=256, workers=4, poll_ms=20):
+        self.root = root
+        self.store_dir = store_dir
+        self.max_items = max_items
+        self.poll_ms = poll_ms
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.images = OrderedDict()
+        self.pending = {}
+        self.results = queue.Queue()
+        self.root.after(self.poll_ms, self._poll)
+
+    def _key(self, path, size):
+        return (os.path.abspath(path), size)
+
+    def get(self, path, callback, size=PREVIEW_SIZE):
+        # callback(photo, error) once the thumbnail is ready, right away on a hit
+        key = self._key(path, size)
+        if key in self.images:
+            self.images.move_to_end(key)
+            callback(self.images[key], None)
+            return
+        self._request(key, path, size).append(callback)
+
+    def prefetch(self, paths, size=PREVIEW_SIZE):
+        # Warm the cache for media the user is likely to open next
+        for path in paths:
+            key = self._key(path, size)
+            if key not in self.images and os.path.isfile(path):
+                self._request(key, path, size)
+
+    def cancel(self, paths, size=PREVIEW_SIZE):
+        # Drop queued decodes nobody is waiting for anymore; ones already
+        # running still finish and land in the cache
+        for path in paths:
+            key = self._key(path, size)
+            if key in self.pending and self.pending[key][0].cancel():
+                del self.pending[key]
+
+    def _request(self, key, path, size):
+        if key not in self.pending:
+            future = self.executor.submit(decode_thumbnail, path, size, self.store_dir)
+            self.pending[key] = (future, [])
+            future.add_done_callback(lambda future: self.results.put((key, future)))
+        return self.pending[key][1]
+
+    def _poll(self):
+        self.root.after(self.poll_ms, self._poll)
+        try:
+            while True:
+                key, future = self.results.get_nowait()
+                if future.cancelled() or self.pending.get(key, (None,))[0] is not future:
+                    continue
+                _, callbacks = self.pending.pop(key)
+                try:
+                    photo, error = ImageTk.PhotoImage(future.result()), None
+                    self._remember(key, photo)
+                except Exception as e:
+                    photo, error = None, e
+                for callback in callbacks:
+                    callback(photo, error)
+        except queue.Empty:
+            pass
+
+    def _remember(self, key, photo):
+        self.images[key] = photo
+        self.images.move_to_end(key)
+        while len(self.images) > self.max_items:
+            self.images.popitem(last=False)
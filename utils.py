@@ -1,9 +1,108 @@
+import fnmatch
 import os
+import sqlite3
+from connections import open_schema_probe
+from diagnostics import traced
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-def find_sqlite_files(folder):
-    db_files = []
-    for root, _, files in os.walk(folder):
-        for file in files:
-            if file.endswith(".db"):
-                db_files.append(os.path.join(root, file))
-    return db_files
\ No newline at end of file
+SQLITE_HEADER = b"SQLite format 3\x00"
+DEFAULT_SCAN_WORKERS = 8
+
+def is_sqlite_file(path):
+    # Databases are recognized by their header, whatever the file is called
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+    except OSError:
+        return False
+
+def describe_sqlite_file(path, size=None):
+    # Returns {"path", "size", "tables"}; tables is None when the schema
+    # can't be read (encrypted or damaged databases)
+    if size is None:
+        size = os.path.getsize(path)
+    tables = None
+    try:
+        conn = open_schema_probe(path)
+        try:
+            tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        pass
+    return {"path": path, "size": size, "tables": tables}
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            break
+        size /= 1024
+    return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+
+def format_db_summary(info):
+    size_text = format_size(info["size"])
+
+    tables = info["tables"]
+    if tables is None:
+        table_text = "unreadable schema"
+    else:
+        shown = ", ".join(tables[:4]) + (", ..." if len(tables) > 4 else "")
+        table_text = f"{len(tables)} tables: {shown}" if tables else "no tables"
+    return f"{info['path']}  ({size_text}, {table_text})"
+
+def _excluded(entry, exclude):
+    return any(fnmatch.fnmatch(entry.name, pattern) or fnmatch.fnmatch(entry.path, pattern) for pattern in exclude)
+
+def _scan_directory(path, depth, exclude, max_depth):
+    # Lists one directory: returns (subdirectories to descend into, databases found)
+    subdirs = []
+    found = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if _excluded(entry, exclude):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        if max_depth is None or depth < max_depth:
+                            subdirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        size = entry.stat(follow_symlinks=False).st_size
+                        # Truncated or carved databases are not a whole number of
+                        # pages, so every file that can hold the header is read
+                        if size >= len(SQLITE_HEADER) and is_sqlite_file(entry.path):
+                            found.append(describe_sqlite_file(entry.path, size))
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return subdirs, found
+
+@traced("scan", rows=len)
+def scan_sqlite_files(folder, on_found=None, exclude=(), max_depth=None, max_workers=DEFAULT_SCAN_WORKERS, should_stop=None):
+    # Walks folder with a pool of directory workers and returns the database
+    # infos (see describe_sqlite_file) sorted by path. on_found(info) is called
+    # for each database as soon as it is found. max_depth counts directory
+    # levels below folder; exclude holds fnmatch patterns for names or paths.
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {executor.submit(_scan_directory, folder, 0, exclude, max_depth): 0}
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                depth = running.pop(future)
+                subdirs, found = future.result()
+                for info in found:
+                    results.append(info)
+                    if on_found is not None:
+                        on_found(info)
+                if should_stop is not None and should_stop():
+                    for pending in running:
+                        pending.cancel()
+                    return sorted(results, key=lambda info: info["path"])
+                for subdir in subdirs:
+                    running[executor.submit(_scan_directory, subdir, depth + 1, exclude, max_depth)] = depth + 1
+    return sorted(results, key=lambda info: info["path"])
+
+def find_sqlite_files(folder, exclude=(), max_depth=None):
+    return [info["path"] for info in scan_sqlite_files(folder, exclude=exclude, max_depth=max_depth)]
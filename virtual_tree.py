@@ -0,0 +1,165 @@
+from tkinter import ttk
+from diagnostics import span
+
+class VirtualTreeview(ttk.Frame):
+    # Treeview that keeps a DataFrame as its backing store and only creates
+    # items for the rows currently scrolled into view. Item ids are row
+    # positions in the frame, so selection maps straight back to .iloc.
+    #
+    # row_values(frame_slice) returns the list of value tuples to show for a
+    # slice of the frame. on_select(position) is called when the selected row
+    # changes, on_near_end() when the view comes within a page of the last
+    # row, for frames loaded page by page (see extend_frame).
+
+    def __init__(self, master, columns, row_values, height=15, column_width=150, on_select=None, on_near_end=None):
+        super().__init__(master)
+        self.row_values = row_values
+        self.on_select = on_select
+        self.on_near_end = on_near_end
+        self.df = None
+        self.offset = 0
+        self.page_size = height
+        self.selected_position = None
+        self.row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+
+        self.tree = ttk.Treeview(self, columns=columns, show='headings', height=height, selectmode="browse")
+        for col in columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=column_width)
+        self.tree.grid(row=0, column=0, sticky="nsew")
+
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.tree.bind("<<TreeviewSelect>>", self.on_tree_select)
+        self.tree.bind("<Configure>", self.on_resize)
+        self.tree.bind("<MouseWheel>", self.on_mousewheel)
+        self.tree.bind("<Button-4>", lambda event: self.scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll_by(3))
+        for key, step in (("<Up>", -1), ("<Down>", 1), ("<Prior>", "-page"), ("<Next>", "page"),
+                          ("<Home>", "home"), ("<End>", "end")):
+            self.tree.bind(key, lambda event, step=step: self.on_key(step))
+
+    def bind_tree(self, sequence, func):
+        self.tree.bind(sequence, func)
+
+    @property
+    def row_count(self):
+        return 0 if self.df is None else len(self.df)
+
+    def set_frame(self, df):
+        # Replacing the backing frame costs O(visible rows)
+        self.df = df
+        self.offset = 0
+        self.selected_position = None
+        self.render()
+
+    def extend_frame(self, df):
+        # Swaps in a frame that starts with the current one, keeping the
+        # scroll position and selection
+        self.df = df
+        self.render()
+
+    def selection(self):
+        return self.selected_position
+
+    def render(self):
+        self.tree.delete(*self.tree.get_children())
+
+        max_offset = max(self.row_count - self.page_size, 0)
+        self.offset = min(max(self.offset, 0), max_offset)
+        end = min(self.offset + self.page_size, self.row_count)
+
+        if self.row_count:
+            with span("treeview.insert", rows=end - self.offset):
+                window = self.df.iloc[self.offset:end]
+                for position, values in zip(range(self.offset, end), self.row_values(window)):
+                    self.tree.insert("", "end", iid=str(position), values=values)
+
+        if self.selected_position is not None and self.offset <= self.selected_position < end:
+            self.tree.selection_set(str(self.selected_position))
+            self.tree.focus(str(self.selected_position))
+
+        if self.row_count:
+            self.scrollbar.set(self.offset / self.row_count, end / self.row_count)
+        else:
+            self.scrollbar.set(0, 1)
+
+        if self.on_near_end is not None and end >= self.row_count - self.page_size:
+            self.on_near_end()
+
+    def scroll_to(self, offset):
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+
+    def scroll_by(self, rows):
+        self.scroll_to(self.offset + rows)
+        return "break"
+
+    def see(self, position, notify=True):
+        # Scroll the row into view and select it
+        if position < self.offset or position >= self.offset + self.page_size:
+            self.offset = position - self.page_size // 2
+        self.select(position, notify)
+
+    def select(self, position, notify=True):
+        # notify=False restores a selection without calling on_select
+        changed = position != self.selected_position
+        self.selected_position = position
+        self.render()
+        if changed and notify and self.on_select is not None:
+            self.on_select(position)
+
+    def on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * self.row_count))
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= self.page_size
+            self.scroll_by(amount)
+
+    def on_mousewheel(self, event):
+        return self.scroll_by(-3 if event.delta > 0 else 3)
+
+    def on_resize(self, event):
+        page_size = max(event.height // self.row_height - 1, 1)
+        if page_size != self.page_size:
+            self.page_size = page_size
+            self.render()
+
+    def on_key(self, step):
+        if not self.row_count:
+            return "break"
+        current = self.selected_position if self.selected_position is not None else self.offset
+        if step == "home":
+            position = 0
+        elif step == "end":
+            position = self.row_count - 1
+        elif step == "page":
+            position = current + self.page_size
+        elif step == "-page":
+            position = current - self.page_size
+        else:
+            position = current + step
+        position = min(max(position, 0), self.row_count - 1)
+
+        if position < self.offset:
+            self.offset = position
+        elif position >= self.offset + self.page_size:
+            self.offset = position - self.page_size + 1
+        self.select(position)
+        return "break"
+
+    def on_tree_select(self, event):
+        selected = self.tree.selection()
+        if not selected:
+            return
+        position = int(selected[0])
+        if position != self.selected_position:
+            self.selected_position = position
+            if self.on_select is not None:
+                self.on_select(position)
@@ -0,0 +1,93 @@
+import queue
+import threading
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    def __init__(self, worker, kind, job_id):
+        self.worker = worker
+        self.kind = kind
+        self.job_id = job_id
+
+    @property
+    def cancelled(self):
+        # A newer job of the same kind supersedes this one
+        return self.worker.latest.get(self.kind) != self.job_id
+
+    def check(self):
+        # Long-running jobs call this between steps to stop early once superseded
+        if self.cancelled:
+            raise JobCancelled()
+
+    def post(self, callback, *args):
+        # Run callback(*args) on the Tk thread, unless the job is superseded by then
+        self.worker.results.put((self, callback, args, False))
+
+class BackgroundWorker:
+    # Runs jobs on a single background thread. Results come back through a
+    # queue that the Tk event loop drains every poll_ms, so callbacks always
+    # run on the Tk thread. Submitting a job of a kind that is already queued
+    # or running cancels the older one.
+
+    def __init__(self, root, poll_ms=20, on_busy_change=None):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.on_busy_change = on_busy_change
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.latest = {}
+        self.pending = 0
+        self.next_id = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.root.after(self.poll_ms, self._poll)
+
+    def submit(self, kind, func, *args, on_done=None, on_error=None):
+        # func(job, *args) runs on the worker thread, on_done(result) and
+        # on_error(exception) on the Tk thread
+        self.next_id += 1
+        job = Job(self, kind, self.next_id)
+        self.latest[kind] = job.job_id
+        self._set_pending(self.pending + 1)
+        self.jobs.put((job, func, args, on_done, on_error))
+        return job
+
+    def cancel(self, kind):
+        self.latest.pop(kind, None)
+
+    @property
+    def busy(self):
+        return self.pending > 0
+
+    def _set_pending(self, pending):
+        was_busy = self.busy
+        self.pending = pending
+        if self.on_busy_change is not None and was_busy != self.busy:
+            self.on_busy_change(self.busy)
+
+    def _run(self):
+        while True:
+            job, func, args, on_done, on_error = self.jobs.get()
+            callback, result = None, ()
+            if not job.cancelled:
+                try:
+                    callback, result = on_done, (func(job, *args),)
+                except JobCancelled:
+                    pass
+                except Exception as e:
+                    callback, result = on_error, (e,)
+            self.results.put((job, callback, result, True))
+
+    def _poll(self):
+        # Reschedule first so a failing callback doesn't stop the polling
+        self.root.after(self.poll_ms, self._poll)
+        try:
+            while True:
+                job, callback, args, finished = self.results.get_nowait()
+                if finished:
+                    self._set_pending(self.pending - 1)
+                if callback is not None and not job.cancelled:
+                    callback(*args)
+        except queue.Empty:
+            pass
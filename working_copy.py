@@ -0,0 +1,87 @@
+import hashlib
+import os
+import sqlite3
+from adapters import AUTO_DETECT, read_schema, get_adapter
+from cache import DEFAULT_CACHE_DIR, ParseCache
+from connections import open_readonly, source_stat
+
+DEFAULT_WORK_DIR = os.path.join(DEFAULT_CACHE_DIR, "work")
+
+def working_copy_path(db_path, work_dir):
+    key = hashlib.sha256(os.path.abspath(db_path).encode("utf-8")).hexdigest()
+    return os.path.join(work_dir, key + ".work.db")
+
+def _mark_used(path):
+    # The parse cache's LRU eviction groups <copy>.used with the copy. The
+    # copy itself is left untouched: its mtime keys the conversation
+    # summary and pooled connections, which touching it would invalidate.
+    marker = path + ".used"
+    with open(marker, "a"):
+        pass
+    os.utime(marker)
+
+def _create_indexes(conn, app_name):
+    # Adds the adapter's filter and join indexes that the copy doesn't have
+    # yet. Returns the number of indexes created.
+    schema = read_schema(conn.cursor())
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    created = 0
+    for name, (table, cols) in get_adapter(app_name, schema).source_indexes(schema).items():
+        if name not in existing:
+            conn.execute(f"CREATE INDEX {name} ON {table} ({', '.join(cols)})")
+            created += 1
+    if created:
+        conn.execute("ANALYZE")
+    conn.commit()
+    return created
+
+def prepare_working_copy(db_path, work_dir=DEFAULT_WORK_DIR, app_name=AUTO_DETECT):
+    # Copies the evidence DB into work_dir and adds the app adapter's filter
+    # and join indexes to the copy, so the source file is never written to.
+    # The copy is reused while the source_stat of the DB (size and mtime of
+    # the file and of its WAL) is unchanged.
+    # work_dir sits in a parse cache directory, whose size budget covers the
+    # copies: older ones are evicted when a new copy is made.
+    os.makedirs(work_dir, exist_ok=True)
+    path = working_copy_path(db_path, work_dir)
+    # Padded to four columns: NULL WAL size and mtime when there is no WAL
+    stat = (source_stat(db_path) + (None, None))[:4]
+
+    if os.path.isfile(path):
+        try:
+            conn = sqlite3.connect(path)
+            try:
+                copied = conn.execute("SELECT size, mtime_ns, wal_size, wal_mtime_ns FROM parsepal_working_copy").fetchone()
+                if copied == stat:
+                    # Another app preset may need indexes the copy lacks
+                    _create_indexes(conn, app_name)
+                    _mark_used(path)
+                    return path
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass
+        os.remove(path)
+
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        source = open_readonly(db_path)
+        conn = sqlite3.connect(tmp_path)
+        source.backup(conn)
+        source.close()
+
+        conn.execute("CREATE TABLE parsepal_working_copy (size INTEGER, mtime_ns INTEGER, wal_size INTEGER, wal_mtime_ns INTEGER)")
+        conn.execute("INSERT INTO parsepal_working_copy VALUES (?, ?, ?, ?)", stat)
+        if not _create_indexes(conn, app_name):
+            conn.execute("ANALYZE")
+            conn.commit()
+        conn.close()
+    except Exception as e:
+        raise RuntimeError(f"Error preparing working copy: {e}")
+
+    os.replace(tmp_path, path)
+    _mark_used(path)
+    ParseCache(os.path.dirname(os.path.abspath(work_dir))).evict(keep=[path])
+    return path